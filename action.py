@@ -1,47 +1,293 @@
+# @File: action.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
 from __future__ import annotations
 """
 Grid actions.
 Should be used in replay and undo features.
+
+A PaintAction may hold a whole stroke. Its steps are packed into typed
+arrays (see PaintSteps), and applied in bulk, as batches of consecutive
+steps of one layer on different squares. Brush paints are recorded by the
+brush's parameters instead (see BrushPaint), at a few bytes per paint.
 """
 
+import sys
+import numpy as np
+from array import array
 from dataclasses import dataclass, field
 from layer_util import Layer
 from grid import Grid
+from brushes import brush_footprint
 
-@dataclass
+@dataclass(slots=True)
 class PaintStep:
 
     affected_grid_square: tuple[int, int]
     affected_layer: Layer
 
     def undo_apply(self, grid: Grid):
-        sq = grid[self.affected_grid_square[0]][self.affected_grid_square[1]]
-        sq.erase(self.affected_layer)
+        grid.erase(self.affected_grid_square[0], self.affected_grid_square[1], self.affected_layer)
+
+    def redo_apply(self, grid: Grid):
+        grid.add(self.affected_grid_square[0], self.affected_grid_square[1], self.affected_layer)
+
+
+class PaintSteps:
+    """
+    The steps of an action, packed into typed arrays: the x and y of every
+    square, and the position of its layer in a small palette of the layers used.
+    Behaves like a list of PaintSteps, which are only created when asked for.
+    """
+
+    TYPECODE = "H"   # Unsigned 16 bit, so grids up to 65536 squares wide
+    __slots__ = ("xs", "ys", "layer_ids", "palette")
+
+    def __init__(self, steps=()) -> None:
+        """
+        Best-Case Complexity = O(n)
+        Worst-Case Complexity = O(n)
+        """
+        self.xs = array(self.TYPECODE)
+        self.ys = array(self.TYPECODE)
+        self.layer_ids = array(self.TYPECODE)
+        self.palette = []   # Layers used, at most a handful per action
+        for step in steps:
+            self.append(step)
+
+    def palette_id(self, layer: Layer) -> int:
+        """
+        The position of a layer in the palette, added if new.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(p), p being the number of layers used
+        """
+        for i, used in enumerate(self.palette):
+            if used is layer:
+                return i
+        self.palette.append(layer)
+        return len(self.palette) - 1
+
+    def append(self, step: PaintStep) -> None:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(p)
+        """
+        x, y = step.affected_grid_square
+        self.xs.append(x)
+        self.ys.append(y)
+        self.layer_ids.append(self.palette_id(step.affected_layer))
+
+    def extend_squares(self, xs, ys, layer: Layer) -> None:
+        """
+        Append a step of the same layer for each square (xs[i], ys[i]).
+        Best-Case Complexity = O(k), k being the number of squares
+        Worst-Case Complexity = O(k + p)
+        """
+        self.xs.frombytes(np.asarray(xs, dtype=np.uint16).tobytes())
+        self.ys.frombytes(np.asarray(ys, dtype=np.uint16).tobytes())
+        self.layer_ids.frombytes(np.full(len(xs), self.palette_id(layer), dtype=np.uint16).tobytes())
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def __getitem__(self, index: int) -> PaintStep:
+        return PaintStep((self.xs[index], self.ys[index]), self.palette[self.layer_ids[index]])
+
+    def __iter__(self):
+        palette = self.palette
+        for x, y, i in zip(self.xs, self.ys, self.layer_ids):
+            yield PaintStep((x, y), palette[i])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (PaintSteps, list, tuple)) or len(self) != len(other):
+            return False
+        return all(a == b for a, b in zip(self, other))
+
+    def __repr__(self) -> str:
+        return f"PaintSteps({list(self)!r})"
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the packed arrays and the palette."""
+        return sys.getsizeof(self.xs) + sys.getsizeof(self.ys) + sys.getsizeof(self.layer_ids) + sys.getsizeof(self.palette)
+
+    def batches(self) -> list[tuple[Layer, np.ndarray, np.ndarray]]:
+        """
+        The steps split into (layer, xs, ys) batches, in order, each of consecutive
+        steps with the same layer on different squares, so a batch can be applied
+        with a single add_many or erase_many.
+        Best-Case Complexity = O(n), one layer per run and no square repeated
+        Worst-Case Complexity = O(nlogn)
+        """
+        if len(self) == 0:
+            return []
+        xs = np.frombuffer(self.xs, dtype=np.uint16).astype(np.int64)
+        ys = np.frombuffer(self.ys, dtype=np.uint16).astype(np.int64)
+        ids = np.frombuffer(self.layer_ids, dtype=np.uint16)
+        # Runs of one layer
+        bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+        starts, ends = np.concatenate(([0], bounds)), np.concatenate((bounds, [len(ids)]))
+        batches = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            layer = self.palette[ids[start]]
+            keys = (xs[start:end] << 16) | ys[start:end]
+            if len(np.unique(keys)) == end - start:
+                batches.append((layer, xs[start:end], ys[start:end]))
+                continue
+            # Some square repeats, cut the run before each repeat
+            seen = set()
+            for i, key in enumerate(keys.tolist(), start):
+                if key in seen:
+                    batches.append((layer, xs[start:i], ys[start:i]))
+                    start, seen = i, set()
+                seen.add(key)
+            batches.append((layer, xs[start:end], ys[start:end]))
+        return batches
+
+
+@dataclass(slots=True)
+class BrushPaint:
+    """
+    One paint of a brush, recorded by its parameters rather than square by square:
+    the brush centres (one, or many along a stroke), its size and shape, the layer,
+    the size of the grid it was clipped to, and which squares of the footprint
+    were actually changed. The changed squares are expanded on the fly.
+
+    Which squares changed is kept in whichever form is smallest: nothing when all
+    of them did, the positions in the footprint of the few which did ("only") or
+    did not ("except"), or else a bitmap ("bits").
+    """
+
+    ENCODE_ALL = "all"
+    ENCODE_ONLY = "only"
+    ENCODE_EXCEPT = "except"
+    ENCODE_BITS = "bits"
+
+    centre_xs: array
+    centre_ys: array
+    size: int
+    shape: str
+    layer: Layer
+    width: int
+    height: int
+    encoding: str   # One of the ENCODE options
+    changed: bytes | None   # The changed squares in that encoding, None if all changed
+    count: int   # Number of changed squares
+
+    @classmethod
+    def record(cls, pxs, pys, size: int, shape: str, layer: Layer, width: int, height: int, changed: np.ndarray) -> BrushPaint:
+        """
+        The record of a paint, given which squares of its brush_footprint were changed.
+        Best-Case Complexity = O(b), b being the number of squares under the brush
+        Worst-Case Complexity = O(b)
+        """
+        changed = np.asarray(changed, dtype=bool)
+        count = int(np.count_nonzero(changed))
+        if count == len(changed):
+            encoding, data = cls.ENCODE_ALL, None
+        else:
+            # 4 bytes per listed position, or 1 bit per square
+            listed = min(count, len(changed) - count) * 4
+            if listed >= (len(changed) + 7) // 8:
+                encoding, data = cls.ENCODE_BITS, np.packbits(changed).tobytes()
+            elif count <= len(changed) - count:
+                encoding, data = cls.ENCODE_ONLY, np.flatnonzero(changed).astype(np.uint32).tobytes()
+            else:
+                encoding, data = cls.ENCODE_EXCEPT, np.flatnonzero(~changed).astype(np.uint32).tobytes()
+        return cls(
+            array("i", np.atleast_1d(pxs).tolist()),
+            array("i", np.atleast_1d(pys).tolist()),
+            size, shape, layer, width, height,
+            encoding, data, count,
+        )
+
+    def squares(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The squares (xs, ys) which the paint changed.
+        Best-Case Complexity = O(b), b being the number of squares under the brush
+        Worst-Case Complexity = O(k*size^2 + b), see brush_footprint
+        """
+        xs, ys = brush_footprint(self.centre_xs, self.centre_ys, self.size, self.shape, self.width, self.height)
+        if self.encoding == self.ENCODE_ALL:
+            return xs, ys
+        if self.encoding == self.ENCODE_BITS:
+            changed = np.unpackbits(np.frombuffer(self.changed, dtype=np.uint8), count=len(xs)).astype(bool)
+        elif self.encoding == self.ENCODE_ONLY:
+            changed = np.frombuffer(self.changed, dtype=np.uint32)
+        else:
+            changed = np.ones(len(xs), dtype=bool)
+            changed[np.frombuffer(self.changed, dtype=np.uint32)] = False
+        return xs[changed], ys[changed]
+
+    def undo_apply(self, grid: Grid):
+        xs, ys = self.squares()
+        grid.erase_many(xs, ys, self.layer)
 
     def redo_apply(self, grid: Grid):
-        sq = grid[self.affected_grid_square[0]][self.affected_grid_square[1]]
-        sq.add(self.affected_layer)
+        xs, ys = self.squares()
+        grid.add_many(xs, ys, self.layer)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the record."""
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.centre_xs) + sys.getsizeof(self.centre_ys)
+            + sys.getsizeof(self.changed)
+        )
 
 
-@dataclass
+@dataclass(slots=True)
 class PaintAction:
 
-    steps: list[PaintStep] = field(default_factory=list)
+    steps: PaintSteps = field(default_factory=PaintSteps)
     is_special: bool = False
+    paints: list[BrushPaint] = field(default_factory=list)   # Applied after the steps
+
+    def __post_init__(self):
+        # Steps may be given as any iterable of PaintSteps, or None for special actions
+        if not isinstance(self.steps, PaintSteps):
+            self.steps = PaintSteps(self.steps or ())
 
     def undo_apply(self, grid: Grid):
         if self.is_special:
             grid.special()
             return
-        for step in self.steps:
-            step.undo_apply(grid)
+        for paint in reversed(self.paints):
+            paint.undo_apply(grid)
+        for layer, xs, ys in reversed(self.steps.batches()):
+            grid.erase_many(xs, ys, layer)
 
     def redo_apply(self, grid: Grid):
         if self.is_special:
             grid.special()
             return
-        for step in self.steps:
-            step.redo_apply(grid)
+        for layer, xs, ys in self.steps.batches():
+            grid.add_many(xs, ys, layer)
+        for paint in self.paints:
+            paint.redo_apply(grid)
 
     def add_step(self, step: PaintStep):
         self.steps.append(step)
+
+    def add_squares(self, xs, ys, layer: Layer):
+        """Add a step of the layer for each square (xs[i], ys[i])."""
+        self.steps.extend_squares(xs, ys, layer)
+
+    def add_paint(self, paint: BrushPaint):
+        """Add a brush paint, unless it changed nothing."""
+        if paint.count > 0:
+            self.paints.append(paint)
+
+    def changed_count(self) -> int:
+        """The number of squares changed by the action, counted once per step."""
+        return len(self.steps) + sum(paint.count for paint in self.paints)
+
+    def is_empty(self) -> bool:
+        """Whether applying the action would do nothing."""
+        return not self.is_special and self.changed_count() == 0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the action, including its packed steps and brush paints."""
+        return sys.getsizeof(self) + self.steps.nbytes + sys.getsizeof(self.paints) + sum(paint.nbytes for paint in self.paints)
@@ -0,0 +1,83 @@
+# @File: benchmarks/memory.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Memory benchmark: bytes per grid square for each draw style, runnable without a window.
+Grids are painted as in benchmarks.render, every square is touched so lazily
+allocated stores exist, and allocations are counted with tracemalloc.
+
+Results are compared with the baseline saved in memory_baseline.json, when it
+was measured with the same size and strokes. --save records the results of the
+current tree as the baseline instead, for example on a checkout from before a
+change. The saved baseline is of the tree with __slots__ and the array
+backends, so later changes are compared with it.
+
+Usage:  python -m benchmarks.memory
+        python -m benchmarks.memory --size 256
+        python -m benchmarks.memory --save
+"""
+
+import argparse
+import json
+import tracemalloc
+from pathlib import Path
+from grid import Grid
+from grid_backends import make_grid
+from benchmarks.render import paint_randomly
+
+BASELINE = Path(__file__).with_name("memory_baseline.json")
+
+def measure(make, strokes: int) -> tuple[int, int]:
+    """
+    Bytes allocated by make() and painting the grid it returns, and the
+    number of squares of that grid.
+    """
+    tracemalloc.start()
+    try:
+        grid = make()
+        paint_randomly(grid, strokes)
+        for x in range(grid.x):
+            for y in range(grid.y):
+                grid.store(x, y)
+        allocated, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return allocated, grid.x * grid.y
+
+def load_baseline(size: int, strokes: int) -> dict[str, float]:
+    """Saved bytes per square by "draw_style name", or {} if none was saved for this size and strokes."""
+    if not BASELINE.exists():
+        return {}
+    baseline = json.loads(BASELINE.read_text())
+    if baseline["size"] != size or baseline["strokes"] != strokes:
+        return {}
+    return baseline["results"]
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--size", type=int, default=128, help="Width and height of the grid.")
+    p.add_argument("--strokes", type=int, default=None, help="Random strokes to paint first.")
+    p.add_argument("--save", action="store_true", help="Save the results as the baseline.")
+    args = p.parse_args()
+
+    strokes = args.strokes if args.strokes is not None else args.size * args.size // 16
+    baseline = {} if args.save else load_baseline(args.size, strokes)
+    results = {}
+    for draw_style in Grid.DRAW_STYLE_OPTIONS:
+        makers = [Grid, make_grid]
+        for make in makers:
+            allocated, squares = measure(lambda: make(draw_style, args.size, args.size), strokes)
+            name = "Grid" if make is Grid else type(make(draw_style, 1, 1)).__name__
+            key = f"{draw_style} {name}"
+            results[key] = round(allocated / squares, 1)
+            line = f"{draw_style:<10} {name:<18} {args.size}x{args.size}: {results[key]:8.1f} bytes/square"
+            if key in baseline:
+                line += f"   baseline {baseline[key]:8.1f} ({results[key] / baseline[key] - 1:+.1%})"
+            print(line)
+
+    if args.save:
+        BASELINE.write_text(json.dumps({"size": args.size, "strokes": strokes, "results": results}, indent=4) + "\n")
+        print(f"Saved the baseline to {BASELINE.name}")
+    elif not baseline:
+        print(f"No baseline saved for {args.size}x{args.size} with {strokes} strokes, see --save.")
@@ -0,0 +1,62 @@
+# @File: benchmarks/render.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Frame time benchmark for Grid.render, runnable without a window.
+
+Usage:  python -m benchmarks.render
+        python -m benchmarks.render --size 256 --frames 5
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+from grid import Grid
+from grid_backends import SharedStackGrid, make_grid
+from layer_util import get_layers
+
+BG = (255, 255, 255)
+
+def paint_randomly(grid: Grid, strokes: int, seed: int = 0) -> None:
+    """Paint random diamonds of random layers onto the grid."""
+    rng = random.Random(seed)
+    layers = [layer for layer in get_layers() if layer is not None]
+    for _ in range(strokes):
+        layer = rng.choice(layers)
+        px, py = rng.randrange(grid.x), rng.randrange(grid.y)
+        xs, ys = [], []
+        for x in range(max(0, px - grid.brush_size), min(grid.x, px + grid.brush_size + 1)):
+            y_paint = grid.brush_size - abs(px - x)
+            for y in range(max(0, py - y_paint), min(grid.y, py + y_paint + 1)):
+                xs.append(x)
+                ys.append(y)
+        grid.add_many(np.array(xs), np.array(ys), layer)
+
+def time_render(grid: Grid, frames: int) -> float:
+    """Average seconds per Grid.render call over a number of frames."""
+    start = time.perf_counter()
+    for frame in range(frames):
+        grid.render(frame / 60, BG)
+    return (time.perf_counter() - start) / frames
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--size", type=int, default=128, help="Width and height of the grid.")
+    p.add_argument("--frames", type=int, default=10, help="Number of frames to render.")
+    p.add_argument("--strokes", type=int, default=None, help="Random strokes to paint first.")
+    args = p.parse_args()
+
+    strokes = args.strokes if args.strokes is not None else args.size * args.size // 16
+    for draw_style in Grid.DRAW_STYLE_OPTIONS:
+        grids = [Grid(draw_style, args.size, args.size)]
+        backend = make_grid(draw_style, args.size, args.size)
+        if type(backend) is not Grid:
+            grids.append(backend)
+        if draw_style == Grid.DRAW_STYLE_ADD:
+            grids.append(SharedStackGrid(args.size, args.size))
+        for grid in grids:
+            paint_randomly(grid, strokes)
+            per_frame = time_render(grid, args.frames)
+            print(f"{draw_style:<10} {type(grid).__name__:<18} {args.size}x{args.size}: {per_frame * 1000:8.2f} ms/frame")
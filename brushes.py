@@ -0,0 +1,163 @@
+# @File: brushes.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Brush footprints: which squares a brush of a given size and shape covers.
+
+Footprints are computed once per (size, shape), as offsets from the brush
+centre and as a boolean mask, so painting only has to shift and clip them.
+A stroke is swept square by square, and painted as the union of the
+footprints along it.
+"""
+
+from __future__ import annotations
+import math
+import numpy as np
+
+BRUSH_DIAMOND = "diamond"
+BRUSH_SQUARE = "square"
+BRUSH_DISC = "disc"
+BRUSH_SHAPES = (
+    BRUSH_DIAMOND,
+    BRUSH_SQUARE,
+    BRUSH_DISC,
+)
+
+_masks = {}   # (size, shape) -> mask
+_offsets = {}   # (size, shape) -> (dx, dy)
+
+def footprint_mask(size: int, shape: str = BRUSH_DIAMOND) -> np.ndarray:
+    """
+    The squares covered by a brush, as a read-only bool array of shape
+    (2*size + 1, 2*size + 1), with the centre at [size, size].
+    - diamond: squares within Manhattan distance size.
+    - square: squares within Chebyshev distance size.
+    - disc: squares within Euclidean distance size.
+    """
+    """
+    Best-Case Complexity = O(1), when cached
+    Worst-Case Complexity = O(size^2)
+    """
+    if shape not in BRUSH_SHAPES:
+        raise ValueError("Invalid brush shape.")
+    if size < 0:
+        raise ValueError("Brush size should not be negative.")
+    key = (size, shape)
+    if key not in _masks:
+        d = np.abs(np.arange(-size, size + 1))
+        dx, dy = d[:, np.newaxis], d[np.newaxis, :]
+        if shape == BRUSH_DIAMOND:
+            mask = dx + dy <= size
+        elif shape == BRUSH_SQUARE:
+            mask = np.maximum(dx, dy) <= size
+        else:
+            mask = dx * dx + dy * dy <= size * size
+        mask.flags.writeable = False
+        _masks[key] = mask
+    return _masks[key]
+
+def footprint_offsets(size: int, shape: str = BRUSH_DIAMOND) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The squares covered by a brush, as arrays (dx, dy) of offsets from the centre,
+    ordered by dx then dy.
+    Best-Case Complexity = O(1), when cached
+    Worst-Case Complexity = O(size^2)
+    """
+    key = (size, shape)
+    if key not in _offsets:
+        dx, dy = np.nonzero(footprint_mask(size, shape))
+        dx, dy = dx - size, dy - size
+        dx.flags.writeable = False
+        dy.flags.writeable = False
+        _offsets[key] = (dx, dy)
+    return _offsets[key]
+
+def footprint(px: int, py: int, size: int, shape: str, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The squares (xs, ys) covered by a brush centred on (px, py), clipped to a
+    width by height grid. Only the rows of offsets which can be on the grid
+    are looked at, found by binary search as the offsets are ordered by dx.
+    """
+    """
+    Best-Case Complexity = O(1), when the brush is off the grid
+    Worst-Case Complexity = O(size^2)
+    """
+    dx, dy = footprint_offsets(size, shape)
+    # Rows with 0 <= px + dx < width
+    start, end = np.searchsorted(dx, [-px, width - px])
+    dx, dy = dx[start:end], dy[start:end]
+    xs, ys = px + dx, py + dy
+    if py - size < 0 or py + size >= height:
+        inside = (ys >= 0) & (ys < height)
+        xs, ys = xs[inside], ys[inside]
+    return xs, ys
+
+def stroke_footprint(pxs, pys, size: int, shape: str, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The squares (xs, ys) covered by a brush centred on any of (pxs[i], pys[i]),
+    clipped to a width by height grid, each square once. The masks of all the
+    centres are combined on one bool canvas, so overlapping brushes along a
+    stroke cost nothing extra when painting.
+    """
+    """
+    Best-Case Complexity = O(1), when every brush is off the grid
+    Worst-Case Complexity = O(k*size^2 + w*h), k being the number of centres
+    and w, h the size of the stroke's bounding box
+    """
+    pxs = np.asarray(pxs, dtype=np.int64)
+    pys = np.asarray(pys, dtype=np.int64)
+    reach = (pxs >= -size) & (pxs < width + size) & (pys >= -size) & (pys < height + size)
+    pxs, pys = pxs[reach], pys[reach]
+    if len(pxs) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    mask = footprint_mask(size, shape)
+    n = 2 * size + 1
+    # The canvas covers the whole stroke, with square (x0, y0) at [0, 0]
+    x0, y0 = int(pxs.min()) - size, int(pys.min()) - size
+    canvas = np.zeros((int(pxs.max()) + size + 1 - x0, int(pys.max()) + size + 1 - y0), dtype=bool)
+    # The corner of each centre's mask is size squares below and left of it
+    for left, bottom in set(zip((pxs - size - x0).tolist(), (pys - size - y0).tolist())):
+        canvas[left:left + n, bottom:bottom + n] |= mask
+    # Clip to the grid
+    left, bottom = max(0, -x0), max(0, -y0)
+    xs, ys = np.nonzero(canvas[left:width - x0, bottom:height - y0])
+    return xs + (x0 + left), ys + (y0 + bottom)
+
+def sweep_cells(x0: float, y0: float, x1: float, y1: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The squares a segment from (x0, y0) to (x1, y1) passes through, in order,
+    with positions measured in squares, so square (x, y) is [x, x+1) by [y, y+1).
+    The segment is cut wherever it crosses a square boundary (a DDA sweep),
+    and each piece lies in exactly one square.
+    """
+    """
+    Best-Case Complexity = O(1), for a segment within one square
+    Worst-Case Complexity = O(klogk), k being the number of squares passed through
+    """
+    cuts = [np.array([0.0, 1.0])]
+    for start, end in ((x0, x1), (y0, y1)):
+        if start != end:
+            lo, hi = min(start, end), max(start, end)
+            bounds = np.arange(math.floor(lo) + 1, math.ceil(hi))
+            cuts.append((bounds - start) / (end - start))
+    ts = np.unique(np.concatenate(cuts))
+    mids = (ts[:-1] + ts[1:]) / 2
+    xs = np.floor(x0 + mids * (x1 - x0)).astype(np.int64)
+    ys = np.floor(y0 + mids * (y1 - y0)).astype(np.int64)
+    # Crossing a corner exactly can leave a piece of no length in a repeated square
+    keep = np.ones(len(xs), dtype=bool)
+    keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    return xs[keep], ys[keep]
+
+def brush_footprint(pxs, pys, size: int, shape: str, width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The squares under a brush centred on (pxs, pys), either single positions or
+    arrays of centres along a stroke. The squares always come in the same order
+    for the same arguments, so they can be matched up with a recorded bitmap.
+    Best-Case Complexity = O(1), when the brush is off the grid
+    Worst-Case Complexity = O(k*size^2 + w*h), see stroke_footprint
+    """
+    if np.size(pxs) == 1:
+        return footprint(int(np.ravel(pxs)[0]), int(np.ravel(pys)[0]), size, shape, width, height)
+    return stroke_footprint(pxs, pys, size, shape, width, height)
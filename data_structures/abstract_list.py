@@ -9,6 +9,8 @@ __docformat__ = 'reStructuredText'
 
 class List(ABC, Generic[T]):
     """ Abstract class for a generic List. """
+    __slots__ = ("length",)
+
     def __init__(self) -> None:
         """ Basic List object initialiser. """
         self.length = 0
@@ -12,6 +12,7 @@ __docformat__ = 'reStructuredText'
 class ArraySortedList(SortedList[T]):
     """ SortedList ADT implemented with arrays. """
     MIN_CAPACITY = 1
+    __slots__ = ("array",)
 
     def __init__(self, max_capacity: int) -> None:
         """ ArraySortedList object initialiser. """
@@ -14,6 +14,8 @@ class BSet(Set[int]):
         elems (int): bitwise representation of the set
     """
 
+    __slots__ = ("elems",)
+
     def __init__(self, dummy_capacity: int = 1) -> None:
         """ Initialization. """
         Set.__init__(self)
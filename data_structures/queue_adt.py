@@ -13,6 +13,7 @@ from data_structures.referential_array import ArrayR, T
 
 class Queue(ABC, Generic[T]):
     """ Abstract class for a generic Queue. """
+    __slots__ = ("length",)
 
     def __init__(self) -> None:
         self.length = 0
@@ -56,6 +57,7 @@ class CircularQueue(Queue[T]):
     ArrayR cannot create empty arrays. So MIN_CAPACITY used to avoid this.
     """
     MIN_CAPACITY = 1
+    __slots__ = ("front", "rear", "array")
 
     def __init__(self,max_capacity:int) -> None:
         Queue.__init__(self)
@@ -13,6 +13,7 @@ T = TypeVar('T')
 
 class Set(ABC, Generic[T]):
     """ Abstract class for a generic Set. """
+    __slots__ = ()
 
     def __init__(self) -> None:
         """ Initialization. """
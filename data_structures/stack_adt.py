@@ -12,6 +12,8 @@ from typing import TypeVar, Generic
 from data_structures.referential_array import ArrayR, T
 
 class Stack(ABC, Generic[T]):
+    __slots__ = ("length",)
+
     def __init__(self) -> None:
         self.length = 0
 
@@ -58,6 +60,7 @@ class ArrayStack(Stack[T]):
     ArrayR cannot create empty arrays. So MIN_CAPACITY used to avoid this.
     """
     MIN_CAPACITY = 1
+    __slots__ = ("array",)
 
     def __init__(self, max_capacity: int) -> None:
         """ Initialises the length and the array with the given capacity.
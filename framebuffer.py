@@ -0,0 +1,81 @@
+# @File: framebuffer.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Texture-side bookkeeping for drawing the grid as a single texture.
+
+This module does not import arcade, so everything here
+can be tested (and profiled) without a window or GL context.
+"""
+
+from __future__ import annotations
+import numpy as np
+
+class GridFramebuffer:
+    """
+    Keeps the last frame uploaded to the grid texture, and works out
+    which part of the texture needs re-uploading for a new frame.
+
+    Frames are given in the Grid.render layout, shape (x, y, 3).
+    Texture data is row-major with row 0 at the bottom, shape (y, x, 3),
+    which is what a GL texture with arcade's y-up coordinates expects.
+    """
+
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.pixels = None   # Last uploaded texture data, or None if nothing uploaded yet
+
+    @staticmethod
+    def to_texture_layout(frame: np.ndarray) -> np.ndarray:
+        """
+        Convert a Grid.render frame to texture layout.
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        return np.ascontiguousarray(frame.transpose(1, 0, 2))
+
+    def update(self, frame: np.ndarray) -> tuple[int, int, int, int] | None:
+        """
+        Store a new frame and return the region which changed since the last one,
+        as (x, y, width, height) in grid squares, or None if nothing changed.
+        The first frame always changes the whole texture.
+        """
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        pixels = self.to_texture_layout(frame)
+        if self.pixels is None or self.pixels.shape != pixels.shape:
+            self.pixels = pixels
+            return (0, 0, self.width, self.height)
+        changed = (pixels != self.pixels).any(axis=2)
+        self.pixels = pixels
+        rows = np.flatnonzero(changed.any(axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(changed.any(axis=0))
+        return (int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+
+    def region_bytes(self, region: tuple[int, int, int, int]) -> bytes:
+        """
+        Tightly packed RGB bytes of a region of the last frame, ready for a texture sub-upload.
+        Best-Case Complexity = O(w*h)
+        Worst-Case Complexity = O(w*h)
+        """
+        x, y, w, h = region
+        return self.pixels[y:y + h, x:x + w].tobytes()
+
+    @staticmethod
+    def screen_rect(region: tuple[int, int, int, int], square_width: float, square_height: float) -> tuple[int, int, int, int]:
+        """
+        Convert a region in grid squares to a pixel rectangle (x, y, width, height),
+        rounded outwards, suitable for a scissor box.
+        """
+        x, y, w, h = region
+        left = int(np.floor(x * square_width))
+        bottom = int(np.floor(y * square_height))
+        right = int(np.ceil((x + w) * square_width))
+        top = int(np.ceil((y + h) * square_height))
+        return (left, bottom, right - left, top - bottom)
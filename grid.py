@@ -1,10 +1,147 @@
 # @File: grid.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-28
+# @Last Edit Date: 2026-10-16
 
 from __future__ import annotations
+import numpy as np
 from data_structures.referential_array import ArrayR
 from layer_store import *
+from layer_compiler import mask_pipeline
+from brushes import BRUSH_DIAMOND, BRUSH_SHAPES, brush_footprint
+
+def group_by(values: np.ndarray) -> list[tuple[int, np.ndarray]]:
+    """
+    Group the positions of equal values together.
+    Returns a list of (value, positions of that value).
+    Best-Case Complexity = O(k*logk)
+    Worst-Case Complexity = O(k*logk)
+    """
+    unique, inverse = np.unique(values, return_inverse=True)
+    order = np.argsort(inverse.reshape(-1), kind="stable")
+    bounds = np.cumsum(np.bincount(inverse.reshape(-1), minlength=len(unique)))[:-1]
+    return list(zip(unique.tolist(), np.split(order, bounds)))
+
+def repeat_rounds(xs, ys) -> list[np.ndarray]:
+    """
+    Split the positions of the squares (xs[i], ys[i]) into rounds of different
+    squares, round j holding the (j+1)-th occurrence of each square, so
+    applying the rounds in order applies repeated squares in sequence.
+    Best-Case Complexity = O(k*logk)
+    Worst-Case Complexity = O(k*logk)
+    """
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    order = np.lexsort((ys, xs))
+    xs, ys = xs[order], ys[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+    if first.all():
+        return [np.arange(len(order))]
+    # Occurrence of each square, counting from its first position in sorted order
+    starts = np.flatnonzero(first)
+    occurrence = np.empty(len(order), dtype=np.int64)
+    occurrence[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+    return [positions for _, positions in group_by(occurrence)]
+
+
+class GridSquare(LayerStore):
+    """
+    A square of a Grid, as handed out by grid[x][y].
+
+    Reads go to the store of the square without allocating it, see Grid.peek,
+    and any other attribute of that store can be read through the view.
+    Changes go through the grid, so an untouched square only gets a store of
+    its own, and is only marked dirty, when it is actually changed.
+    """
+
+    __slots__ = ("grid", "x", "y")
+
+    def __init__(self, grid: Grid, x: int, y: int) -> None:
+        super().__init__()
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    def __getattr__(self, name):
+        if name in GridSquare.__slots__:
+            # Not set yet, such as while copying
+            raise AttributeError(name)
+        return getattr(self.grid.peek(self.x, self.y), name)
+
+    def add(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.add
+        """
+        return self.grid.add(self.x, self.y, layer)
+
+    def erase(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.erase
+        """
+        return self.grid.erase(self.x, self.y, layer)
+
+    def special(self):
+        """
+        Apply the special to this square only.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(s), s being the cost of LayerStore.special
+        """
+        self.grid.store(self.x, self.y).special()
+        self.grid.mark_dirty(self.x, self.y)
+
+    def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.get_color
+        """
+        return self.grid.peek(self.x, self.y).get_color(start, timestamp, x, y)
+
+    def is_animated(self) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.is_animated
+        """
+        return self.grid.peek(self.x, self.y).is_animated()
+
+    def copy(self) -> LayerStore:
+        """
+        Returns an independent store with the same layers and mode.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.copy
+        """
+        return self.grid.peek(self.x, self.y).copy()
+
+
+class GridRow:
+    """
+    A single column of the grid, as handed out by Grid.__getitem__.
+
+    Indexing it returns a view of a square, see Grid.square, so reading
+    a square neither allocates a store for it nor marks it dirty.
+    """
+
+    def __init__(self, grid: Grid, x: int) -> None:
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y: int) -> LayerStore:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.square(self.x, y)
+
+    def __setitem__(self, y: int, store: LayerStore) -> None:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.grid.mark_dirty(self.x, y)
+        self.grid.put(self.x, y, store)
+
+    def __len__(self) -> int:
+        return self.grid.y
 
 class Grid:
     DRAW_STYLE_SET = "SET"
@@ -17,8 +154,9 @@ class Grid:
     )
 
     DEFAULT_BRUSH_SIZE = 2
-    MAX_BRUSH = 5
+    MAX_BRUSH = 128
     MIN_BRUSH = 0
+    DEFAULT_BRUSH_SHAPE = BRUSH_DIAMOND
 
     def __init__(self, draw_style, x, y) -> None:
         """
@@ -38,28 +176,115 @@ class Grid:
         self.y = y
         self.draw_style = draw_style
         self.brush_size = self.DEFAULT_BRUSH_SIZE   # Set the brush size to the default size
+        self.brush_shape = self.DEFAULT_BRUSH_SHAPE
         self.initialize(self.x, self.y)
         
 
     def initialize(self, x, y):
         """
-        Best-Case Complexity = O(x*y)
+        Create an empty grid of size x by y.
+
+        Stores are only allocated when a square is first written to.
+        Until then every square shares self.blank, an empty store
+        which must not be modified.
+
+        Specials are applied lazily: self.epoch counts the specials so far,
+        and each allocated store is kept with the count it has seen.
+        A store catches up the next time it is read or written, see peek.
+        """
+        """
+        Best-Case Complexity = O(x*y), filling the render cache
         Worst-Case Complexity = O(x*y)
         """
-        # create grid
+        self.x = x
+        self.y = y
+        # Render cache: last colour of each square, which squares changed since
+        # the last render, and which squares contain time dependent layers.
+        self.colors = np.zeros((x, y, 3), dtype=np.uint8)
+        self.dirty = np.ones((x, y), dtype=bool)
+        self.animated = np.zeros((x, y), dtype=bool)
+        self.allocated = np.zeros((x, y), dtype=bool)
+        self.rendered_background = None
+        self.epoch = 0
+        self.blank_epoch = 0
+        self.rendered_epoch = 0
+        # create grid: each column is None until written to, then a dict
+        # y -> (store, specials applied to it)
         self.grid = ArrayR(x)
-        for i in range(x):
-            row = ArrayR(y)
-            for j in range(y):
-                # Select the LayerStore class based on the drawing style
-                if self.draw_style == Grid.DRAW_STYLE_SET:
-                    layer_store = SetLayerStore()
-                elif self.draw_style == Grid.DRAW_STYLE_ADD:
-                    layer_store = AdditiveLayerStore()
-                elif self.draw_style == Grid.DRAW_STYLE_SEQUENCE:
-                    layer_store = SequenceLayerStore()
-                row[j] = layer_store
-            self.grid[i] = row
+        # Select the LayerStore class based on the drawing style
+        if self.draw_style == Grid.DRAW_STYLE_SET:
+            self.blank = SetLayerStore()
+        elif self.draw_style == Grid.DRAW_STYLE_ADD:
+            self.blank = AdditiveLayerStore()
+        elif self.draw_style == Grid.DRAW_STYLE_SEQUENCE:
+            self.blank = SequenceLayerStore()
+
+    def peek(self, x, y) -> LayerStore:
+        """
+        The store of the square at (x, y), for reading only.
+        Untouched squares return the shared self.blank.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        column = self.grid[x]
+        if column is None or y not in column:
+            return self.get_blank()
+        layer_store, epoch = column[y]
+        if epoch < self.epoch:
+            layer_store.apply_specials(self.epoch - epoch)
+            column[y] = (layer_store, self.epoch)
+        return layer_store
+
+    def get_blank(self) -> LayerStore:
+        """
+        The store shared by untouched squares, with all specials so far applied.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1), the blank store being empty
+        """
+        if self.blank_epoch != self.epoch:
+            # Replace rather than modify, as stores copied from it may still be in use
+            self.blank = self.blank.copy()
+            self.blank.apply_specials(self.epoch - self.blank_epoch)
+            self.blank_epoch = self.epoch
+        return self.blank
+
+    def square(self, x, y) -> LayerStore:
+        """
+        A view of the square at (x, y), which reads without allocating,
+        as handed out by grid[x][y].
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if not (0 <= x < self.x and 0 <= y < self.y):
+            raise IndexError("Grid square out of range.")
+        return GridSquare(self, x, y)
+
+    def store(self, x, y) -> LayerStore:
+        """
+        The store of the square at (x, y), allocating it if the square is untouched.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(p*s), p being the pending specials of the square
+        """
+        if not 0 <= y < self.y:
+            raise IndexError("Grid square out of range.")
+        column = self.grid[x]
+        if column is None or y not in column:
+            self.put(x, y, self.get_blank().copy())
+        return self.peek(x, y)
+
+    def put(self, x, y, layer_store: LayerStore) -> None:
+        """
+        Make layer_store the store of the square at (x, y), as having seen
+        every special so far.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        column = self.grid[x]
+        if column is None:
+            column = {}
+            self.grid[x] = column
+        column[y] = (layer_store, self.epoch)
+        self.allocated[x, y] = True
 
     def increase_brush_size(self):
         """
@@ -87,27 +312,211 @@ class Grid:
         if self.brush_size > self.MIN_BRUSH:
             self.brush_size -= 1
 
+    def next_brush_shape(self):
+        """
+        Switch to the next of BRUSH_SHAPES.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.brush_shape = BRUSH_SHAPES[(BRUSH_SHAPES.index(self.brush_shape) + 1) % len(BRUSH_SHAPES)]
+
+    def paint(self, layer: Layer, px, py) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Add a layer to every square under the brush centred on (px, py),
+        as one bulk add_many. Squares off the grid are ignored.
+        px and py may also be arrays of centres along a stroke, in which case
+        every square under any of them gets the layer once.
+        Returns the squares (xs, ys) which were actually changed.
+        """
+        """
+        Best-Case Complexity = O(b), b being the number of squares under the brush
+        Worst-Case Complexity = O(b*n), n being the cost of a single add
+        """
+        xs, ys, changed = self.paint_footprint(layer, px, py)
+        return xs[changed], ys[changed]
+
+    def paint_footprint(self, layer: Layer, px, py) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        As paint, but returns every square under the brush (xs, ys), in the
+        order of brush_footprint, with a bool array of which were changed.
+        Best-Case Complexity = O(b), b being the number of squares under the brush
+        Worst-Case Complexity = O(b*n), n being the cost of a single add
+        """
+        xs, ys = brush_footprint(px, py, self.brush_size, self.brush_shape, self.x, self.y)
+        return xs, ys, self.add_many(xs, ys, layer)
+
     def special(self):
         """
         Activate the special affect on all grid squares.
+        This only counts the special, each store applies it when next used.
         """
         """
-        Best-Case Complexity = O(x*y)
-        Worst-Case Complexity = O(x*y)
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.epoch += 1
+
+    def add(self, x, y, layer: Layer) -> bool:
+        """
+        Add a layer to the square at (x, y).
+        Returns true if the square was actually changed.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.add
         """
-        # Cycle through each row and column of the grid and 
-        # activate special effects on the corresponding layer storage object
-        for i in range(self.x):
-            for j in range(self.y):
-                self.grid[i][j].special()
+        layer_store = self.peek(x, y)
+        if layer_store is self.blank:
+            # Only allocate the square if the add changes it
+            layer_store = self.blank.copy()
+            if not layer_store.add(layer):
+                return False
+            self.put(x, y, layer_store)
+            changed = True
+        else:
+            changed = layer_store.add(layer)
+        if changed:
+            self.dirty[x, y] = True
+        return changed
+
+    def erase(self, x, y, layer: Layer) -> bool:
+        """
+        Erase a layer from the square at (x, y).
+        Returns true if the square was actually changed.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), n being the cost of LayerStore.erase
+        """
+        layer_store = self.peek(x, y)
+        if layer_store is self.blank:
+            # Only allocate the square if the erase changes it
+            layer_store = self.blank.copy()
+            if not layer_store.erase(layer):
+                return False
+            self.put(x, y, layer_store)
+            changed = True
+        else:
+            changed = layer_store.erase(layer)
+        if changed:
+            self.dirty[x, y] = True
+        return changed
+
+    def add_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Add a layer to each square (xs[i], ys[i]), in order, so a square
+        which repeats is changed once per occurrence.
+        Returns a bool array of which squares were actually changed.
+        """
+        """
+        Best-Case Complexity = O(k), k being the number of squares
+        Worst-Case Complexity = O(k*n), n being the cost of LayerStore.add
+        """
+        return np.array([self.add(x, y, layer) for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist())], dtype=bool)
+
+    def erase_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Erase a layer from each square (xs[i], ys[i]), in order, so a square
+        which repeats is changed once per occurrence.
+        Returns a bool array of which squares were actually changed.
+        """
+        """
+        Best-Case Complexity = O(k), k being the number of squares
+        Worst-Case Complexity = O(k*n), n being the cost of LayerStore.erase
+        """
+        return np.array([self.erase(x, y, layer) for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist())], dtype=bool)
+
+    def mark_dirty(self, x, y):
+        """
+        Recompute the colour of the square at (x, y) on the next render.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.dirty[x, y] = True
         
 
+    def render(self, timestamp, background) -> np.ndarray:
+        """
+        Render the grid into a framebuffer, without needing a window.
+        - timestamp: The current time, as passed to the layers.
+        - background: The starting colour of every grid square.
+
+        Returns a C-contiguous uint8 array of shape (x, y, 3),
+        where buffer[i, j] is the colour of grid square (i, j).
+
+        Colours are cached between renders, and only squares which are dirty
+        or contain animated layers are recomputed. Untouched squares all share
+        the colour of the blank store, which is computed once.
+        """
+        """
+        Best-Case Complexity = O(x*y), copying the cached colours
+        Worst-Case Complexity = O(x*y + s*n), s being the number of allocated stores
+        and n the cost of get_color
+        """
+        background = tuple(background)
+        # SET and ADD specials are involutions, so only the parity of the
+        # specials since the last render changes any colour.
+        if self.draw_style == Grid.DRAW_STYLE_SEQUENCE:
+            specials_changed = self.epoch != self.rendered_epoch
+        else:
+            specials_changed = (self.epoch - self.rendered_epoch) % 2 == 1
+        if background != self.rendered_background or specials_changed:
+            self.rendered_background = background
+            self.rendered_epoch = self.epoch
+            self.dirty[:] = True
+        # Whether a square is animated can only change when it is dirty
+        # Untouched squares are never animated, as the blank store is empty.
+        dirty_x, dirty_y = np.nonzero(self.dirty & self.allocated)
+        if len(dirty_x) > 0:
+            self.animated[dirty_x, dirty_y] = [
+                self.peek(i, j).is_animated()
+                for i, j in zip(dirty_x.tolist(), dirty_y.tolist())
+            ]
+        blank = self.dirty & ~self.allocated
+        if blank.any():
+            self.colors[blank] = self.get_blank().get_color(background, timestamp, 0, 0)
+        stale_x, stale_y = np.nonzero((self.dirty | self.animated) & self.allocated)
+        if len(stale_x) > 0 and self.draw_style == Grid.DRAW_STYLE_SEQUENCE:
+            self.render_masks(stale_x, stale_y, timestamp, background)
+        elif len(stale_x) > 0:
+            self.colors[stale_x, stale_y] = [
+                self.peek(i, j).get_color(background, timestamp, i, j)
+                for i, j in zip(stale_x.tolist(), stale_y.tolist())
+            ]
+        self.dirty[:] = False
+        return self.colors.copy()
+
+    def render_masks(self, xs, ys, timestamp, background):
+        """
+        Recompute the colours of the SEQUENCE squares (xs[i], ys[i]), grouped by
+        their layer mask. Each group uses the cached pipeline of its mask, see
+        mask_pipeline, evaluated just once if it does not read the position.
+        """
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk + k*n), n being the cost of a pipeline
+        """
+        masks = np.array([self.peek(i, j).layers.elems for i, j in zip(xs.tolist(), ys.tolist())], dtype=np.int64)
+        for mask, cells in group_by(masks):
+            pipeline = mask_pipeline(mask)
+            group_x, group_y = xs[cells], ys[cells]
+            if pipeline.positional:
+                # Per square, rather than with the batch kernels, to match get_color exactly
+                self.colors[group_x, group_y] = [
+                    pipeline(background, timestamp, i, j)
+                    for i, j in zip(group_x.tolist(), group_y.tolist())
+                ]
+            else:
+                self.colors[group_x, group_y] = pipeline(background, timestamp, 0, 0)
+
     def __getitem__(self, index):
         """
         Best-Case Complexity = O(1)
         Worst-Case Complexity = O(1)
         """
         # Index to access the content of a Grid object
-        return self.grid[index]
+        if not 0 <= index < self.x:
+            raise IndexError("Grid column out of range.")
+        return GridRow(self, index)
 
 
@@ -0,0 +1,1362 @@
+# @File: grid_backends.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Alternative Grid implementations, which keep the state of every square
+in a few numpy arrays instead of one LayerStore object per square.
+
+They have the same interface as Grid. Indexing them, grid[x][y], hands out
+a light view of the square implementing the LayerStore interface, so code
+written against the object grid keeps working.
+"""
+
+from __future__ import annotations
+import functools
+import numpy as np
+from grid import Grid, group_by, repeat_rounds
+from layer_store import AdditiveLayerStore, LayerRun, LayerStore, SequenceLayerStore, SetLayerStore
+from layer_util import COLOR_DTYPE, Layer, get_layers
+from layer_compiler import compile_chain, mask_pipeline, render_pipeline
+
+def registered_layers() -> list[Layer]:
+    """All registered layers, in index order."""
+    layers = get_layers()
+    return [layers[i] for i in range(len(layers)) if layers[i] is not None]
+
+def in_sequence(many):
+    """
+    Wrap the add_many or erase_many of a backend, which changes each square
+    at most once per call, so a square which repeats is changed once per
+    occurrence, in order, as Grid.add_many does one square at a time.
+    """
+    @functools.wraps(many)
+    def apply(self, xs, ys, layer: Layer) -> np.ndarray:
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        rounds = repeat_rounds(xs, ys)
+        if len(rounds) == 1:
+            return many(self, xs, ys, layer)
+        changed = np.zeros(len(xs), dtype=bool)
+        for rows in rounds:
+            changed[rows] = many(self, xs[rows], ys[rows], layer)
+        return changed
+    return apply
+
+class SequenceCell(LayerStore):
+    """
+    A square of a MaskSequenceGrid, behaving like a SequenceLayerStore.
+    Changes are written straight through to the grid.
+    """
+
+    __slots__ = ("grid", "x", "y")
+
+    def __init__(self, grid: MaskSequenceGrid, x: int, y: int) -> None:
+        super().__init__()
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    @property
+    def mask(self) -> int:
+        self.grid.settle()
+        return int(self.grid.masks[self.x, self.y])
+
+    def add(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.add(self.x, self.y, layer)
+
+    def erase(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.erase(self.x, self.y, layer)
+
+    def special(self):
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n)
+        """
+        store = self.copy()
+        store.special()
+        self.grid.masks[self.x, self.y] = store.layers.elems
+        self.grid.mark_dirty(self.x, self.y)
+
+    def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n)
+        """
+        return mask_pipeline(self.mask)(start, timestamp, x, y)
+
+    def is_animated(self) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n)
+        """
+        return mask_pipeline(self.mask).animated
+
+    def copy(self) -> SequenceLayerStore:
+        """
+        Returns a standalone SequenceLayerStore with the same layers.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        store = SequenceLayerStore()
+        store.layers.elems = self.mask
+        return store
+
+
+class MaskSequenceGrid(Grid):
+    """
+    A SEQUENCE grid storing the layers of every square as bits of one
+    uint32 array, `masks` (registered layers have indices below 20).
+
+    Painting a footprint is a masked bitwise or / and-not, special removes
+    the median named layer of every square at once, and rendering evaluates
+    the pipeline of each distinct mask once, over all its squares,
+    with the batch kernels, see render_pipeline.
+
+    Specials are only counted, and applied together the next time the
+    masks are used, see settle. `masks` is only up to date after settle.
+    """
+
+    def __init__(self, x, y) -> None:
+        super().__init__(Grid.DRAW_STYLE_SEQUENCE, x, y)
+
+    def initialize(self, x, y):
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        self.x = x
+        self.y = y
+        self.masks = np.zeros((x, y), dtype=np.uint32)
+        self.pending_specials = 0
+        self.colors = np.zeros((x, y, 3), dtype=np.uint8)
+        self.dirty = np.ones((x, y), dtype=bool)
+        self.animated = np.zeros((x, y), dtype=bool)
+        self.rendered_background = None
+
+    def peek(self, x, y) -> SequenceCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def store(self, x, y) -> SequenceCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if not (0 <= x < self.x and 0 <= y < self.y):
+            raise IndexError("Grid square out of range.")
+        return SequenceCell(self, x, y)
+
+    def square(self, x, y) -> SequenceCell:
+        """
+        The views of the squares write through already.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def add(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.settle()
+        bit = np.uint32(1 << layer.index)
+        if self.masks[x, y] & bit:
+            return False
+        self.masks[x, y] |= bit
+        self.dirty[x, y] = True
+        return True
+
+    def erase(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.settle()
+        bit = np.uint32(1 << layer.index)
+        if not self.masks[x, y] & bit:
+            return False
+        self.masks[x, y] &= ~bit
+        self.dirty[x, y] = True
+        return True
+
+    @in_sequence
+    def add_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk)
+        """
+        self.settle()
+        bit = np.uint32(1 << layer.index)
+        changed = (self.masks[xs, ys] & bit) == 0
+        xs, ys = np.asarray(xs)[changed], np.asarray(ys)[changed]
+        self.masks[xs, ys] |= bit
+        self.dirty[xs, ys] = True
+        return changed
+
+    @in_sequence
+    def erase_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk)
+        """
+        self.settle()
+        bit = np.uint32(1 << layer.index)
+        changed = (self.masks[xs, ys] & bit) != 0
+        xs, ys = np.asarray(xs)[changed], np.asarray(ys)[changed]
+        self.masks[xs, ys] &= ~bit
+        self.dirty[xs, ys] = True
+        return changed
+
+    def special(self):
+        """
+        Of the applied layers of every square, remove the one with median name
+        (the smaller of the two for an even count), as SequenceLayerStore.special.
+        This only counts the special, it is applied by the next settle.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.pending_specials += 1
+
+    def settle(self) -> None:
+        """
+        Apply the pending specials. Each only looks at the squares still
+        painted after the one before, and once no square is painted the
+        rest are skipped, as they would change nothing.
+        """
+        """
+        Best-Case Complexity = O(1), when no special is pending
+        Worst-Case Complexity = O(x*y + s*k*n), s being the number of pending specials
+        and k the number of painted squares
+        """
+        if self.pending_specials == 0:
+            return
+        pending, self.pending_specials = self.pending_specials, 0
+        painted_x, painted_y = np.nonzero(self.masks)
+        masks = self.masks[painted_x, painted_y]
+        layers = registered_layers()
+        by_name = sorted(layers, key=lambda layer: layer.name)
+        self.dirty[painted_x, painted_y] = True
+        for _ in range(pending):
+            if len(masks) == 0:
+                break
+            counts = np.zeros(len(masks), dtype=np.int16)
+            for layer in layers:
+                counts += ((masks >> np.uint32(layer.index)) & 1).astype(np.int16)
+            # Rank of the median among the applied layers, in name order
+            median = (counts - 1) // 2
+            seen = np.zeros(len(masks), dtype=np.int16)
+            remove = np.zeros(len(masks), dtype=np.uint32)
+            for layer in by_name:
+                applied = ((masks >> np.uint32(layer.index)) & 1).astype(bool)
+                remove[applied & (seen == median)] = np.uint32(1 << layer.index)
+                seen += applied
+            masks = masks & ~remove
+            self.masks[painted_x, painted_y] = masks
+            # Squares emptied by this special are unchanged by the rest
+            left = masks != 0
+            painted_x, painted_y, masks = painted_x[left], painted_y[left], masks[left]
+
+    def render(self, timestamp, background) -> np.ndarray:
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y*n), n being the length of the longest chain
+        """
+        self.settle()
+        background = tuple(background)
+        if background != self.rendered_background:
+            self.rendered_background = background
+            self.dirty[:] = True
+        stale_x, stale_y = np.nonzero(self.dirty | self.animated)
+        for mask, cells in group_by(self.masks[stale_x, stale_y]):
+            xs, ys = stale_x[cells], stale_y[cells]
+            pipeline = mask_pipeline(mask)
+            self.animated[xs, ys] = pipeline.animated
+            self.colors[xs, ys] = render_pipeline(pipeline, background, timestamp, xs, ys)
+        self.dirty[:] = False
+        return self.colors.copy()
+
+
+class SetCell(LayerStore):
+    """
+    A square of an IndexSetGrid, behaving like a SetLayerStore.
+    Changes are written straight through to the grid.
+    """
+
+    __slots__ = ("grid", "x", "y")
+
+    def __init__(self, grid: IndexSetGrid, x: int, y: int) -> None:
+        super().__init__()
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    @property
+    def layer(self) -> Layer | None:
+        return self.grid.layer_at(self.x, self.y)
+
+    @property
+    def mode(self) -> bool:
+        return self.grid.mode_at(self.x, self.y)
+
+    def add(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.add(self.x, self.y, layer)
+
+    def erase(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.erase(self.x, self.y, layer)
+
+    def special(self):
+        """
+        Invert this square only.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y), allocating the per square inversions
+        """
+        self.grid.flip(self.x, self.y)
+
+    def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.copy().get_color(start, timestamp, x, y)
+
+    def is_animated(self) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        layer = self.layer
+        return layer is not None and layer.animated
+
+    def copy(self) -> SetLayerStore:
+        """
+        Returns a standalone SetLayerStore with the same layer and mode.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        store = SetLayerStore()
+        store.layer = self.layer
+        store.mode = self.mode
+        return store
+
+
+class IndexSetGrid(Grid):
+    """
+    A SET grid storing the layer of every square as one small index,
+    0 for no layer and layer.index + 1 otherwise, in a uint8 array `layers`.
+
+    Grid.special inverts every square, so the inversion is kept once for the
+    whole grid in `inverted`, making special (and undoing or replaying it) O(1).
+    Squares inverted on their own, through SetCell.special, are kept in
+    `flipped`, which is only allocated when first needed.
+
+    Cached colours are kept before the grid-wide inversion, which is applied
+    when the frame is copied out of the cache.
+    """
+
+    def __init__(self, x, y) -> None:
+        super().__init__(Grid.DRAW_STYLE_SET, x, y)
+
+    def initialize(self, x, y):
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        self.x = x
+        self.y = y
+        self.layers = np.zeros((x, y), dtype=np.uint8)
+        self.inverted = False
+        self.flipped = None
+        self.colors = np.zeros((x, y, 3), dtype=np.uint8)
+        self.dirty = np.ones((x, y), dtype=bool)
+        self.animated = np.zeros((x, y), dtype=bool)
+        self.rendered_background = None
+
+    def layer_at(self, x, y) -> Layer | None:
+        """
+        The layer of the square at (x, y), or None.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        index = int(self.layers[x, y])
+        return None if index == 0 else get_layers()[index - 1]
+
+    def mode_at(self, x, y) -> bool:
+        """
+        Whether the square at (x, y) is inverted, as SetLayerStore.mode.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if self.flipped is None:
+            return self.inverted
+        return self.inverted != bool(self.flipped[x, y])
+
+    def peek(self, x, y) -> SetCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def store(self, x, y) -> SetCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if not (0 <= x < self.x and 0 <= y < self.y):
+            raise IndexError("Grid square out of range.")
+        return SetCell(self, x, y)
+
+    def square(self, x, y) -> SetCell:
+        """
+        The views of the squares write through already.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def add(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if self.layers[x, y] == layer.index + 1:
+            return False
+        self.layers[x, y] = layer.index + 1
+        self.dirty[x, y] = True
+        return True
+
+    def erase(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if self.layers[x, y] == 0:
+            return False
+        self.layers[x, y] = 0
+        self.dirty[x, y] = True
+        return True
+
+    @in_sequence
+    def add_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk)
+        """
+        changed = self.layers[xs, ys] != layer.index + 1
+        xs, ys = np.asarray(xs)[changed], np.asarray(ys)[changed]
+        self.layers[xs, ys] = layer.index + 1
+        self.dirty[xs, ys] = True
+        return changed
+
+    @in_sequence
+    def erase_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk)
+        """
+        changed = self.layers[xs, ys] != 0
+        xs, ys = np.asarray(xs)[changed], np.asarray(ys)[changed]
+        self.layers[xs, ys] = 0
+        self.dirty[xs, ys] = True
+        return changed
+
+    def special(self):
+        """
+        Invert the colour of every square.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.inverted = not self.inverted
+
+    def flip(self, x, y):
+        """
+        Invert the colour of the square at (x, y) only.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y), allocating the per square inversions
+        """
+        if self.flipped is None:
+            self.flipped = np.zeros((self.x, self.y), dtype=bool)
+        self.flipped[x, y] = not self.flipped[x, y]
+        self.dirty[x, y] = True
+
+    def render(self, timestamp, background) -> np.ndarray:
+        """
+        Renders exactly as the object grid: every square starts from the same
+        background, so layers not reading the position are applied once per frame,
+        rainbows once per diagonal, and only sparkle runs its batch kernel.
+        """
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        background = tuple(background)
+        if background != self.rendered_background:
+            self.rendered_background = background
+            self.dirty[:] = True
+        stale_x, stale_y = np.nonzero(self.dirty | self.animated)
+        layers = get_layers()
+        for index, cells in group_by(self.layers[stale_x, stale_y]):
+            xs, ys = stale_x[cells], stale_y[cells]
+            layer = None if index == 0 else layers[index - 1]
+            self.animated[xs, ys] = layer is not None and layer.animated
+            if layer is None:
+                self.colors[xs, ys] = background
+            elif layer.positional and layer.key is None:
+                start = np.empty((len(cells), 3), dtype=COLOR_DTYPE)
+                start[:] = background
+                self.colors[xs, ys] = layer.apply_batch(start, timestamp, xs, ys)
+            else:
+                keys = layer.key(xs, ys) if layer.positional else np.zeros(len(cells), dtype=int)
+                _, first, classes = np.unique(keys, return_index=True, return_inverse=True)
+                values = np.array([
+                    layer.apply(background, timestamp, int(xs[i]), int(ys[i])) for i in first
+                ], dtype=np.uint8)
+                self.colors[xs, ys] = values[classes.reshape(-1)]
+        if self.flipped is not None:
+            flipped = self.flipped[stale_x, stale_y]
+            xs, ys = stale_x[flipped], stale_y[flipped]
+            self.colors[xs, ys] = 255 - self.colors[xs, ys]
+        self.dirty[:] = False
+        if self.inverted:
+            return 255 - self.colors
+        return self.colors.copy()
+
+
+class Stack:
+    """
+    An immutable ADD style stack of layers, as a tuple of (layer index, count) runs.
+
+    Stacks are interned by a StackTable, so equal stacks are one object
+    shared by every square holding them. Each stack remembers the stacks
+    reached from it by push, serve and reverse, and its compiled chain.
+    """
+
+    __slots__ = ("table", "runs", "id", "depth", "pushed", "served", "reversed", "pipeline")
+
+    def __init__(self, table: StackTable, runs: tuple[tuple[int, int], ...], id: int) -> None:
+        self.table = table
+        self.runs = runs
+        self.id = id
+        self.depth = sum(count for _, count in runs)
+        self.pushed = {}   # layer index -> stack with that layer added last
+        self.served = None   # Stack with the first layer removed
+        self.reversed = None   # Stack in the reverse order
+        self.pipeline = None   # Compiled chain, see get_pipeline
+
+    def layer_runs(self) -> list[tuple[Layer, int]]:
+        """The runs of this stack, as (layer, count) pairs."""
+        layers = get_layers()
+        return [(layers[index], count) for index, count in self.runs]
+
+    def push(self, layer: Layer) -> Stack:
+        """
+        The stack with layer added last.
+        Best-Case Complexity = O(1), when already seen
+        Worst-Case Complexity = O(r), r being the number of runs
+        """
+        if layer.index not in self.pushed:
+            runs = self.runs
+            if runs and runs[-1][0] == layer.index:
+                runs = runs[:-1] + ((layer.index, runs[-1][1] + 1),)
+            else:
+                runs = runs + ((layer.index, 1),)
+            self.pushed[layer.index] = self.table.intern(runs)
+        return self.pushed[layer.index]
+
+    def serve(self) -> Stack:
+        """
+        The stack with the first layer removed, itself if empty.
+        Best-Case Complexity = O(1), when already seen
+        Worst-Case Complexity = O(r)
+        """
+        if self.served is None:
+            runs = self.runs
+            if runs and runs[0][1] > 1:
+                runs = ((runs[0][0], runs[0][1] - 1),) + runs[1:]
+            else:
+                runs = runs[1:]
+            self.served = self.table.intern(runs)
+        return self.served
+
+    def reverse(self) -> Stack:
+        """
+        The stack in the reverse order.
+        Best-Case Complexity = O(1), when already seen
+        Worst-Case Complexity = O(r)
+        """
+        if self.reversed is None:
+            self.reversed = self.table.intern(self.runs[::-1])
+            self.reversed.reversed = self
+        return self.reversed
+
+    def get_pipeline(self) -> function:
+        """
+        The stack compiled into a single callable, see layer_compiler.
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(r*256*logd), d being the depth
+        """
+        if self.pipeline is None:
+            self.pipeline = compile_chain(self.layer_runs())
+        return self.pipeline
+
+    @property
+    def animated(self) -> bool:
+        return self.get_pipeline().animated
+
+
+class StackTable:
+    """
+    Interns Stacks by their runs, numbering them in order of creation.
+    The empty stack is number 0.
+    """
+
+    def __init__(self) -> None:
+        self.stacks = []   # id -> Stack
+        self.index = {}   # runs -> Stack
+        self.empty = self.intern(())
+
+    def intern(self, runs: tuple[tuple[int, int], ...]) -> Stack:
+        """
+        The one Stack with these runs.
+        Best-Case Complexity = O(r)
+        Worst-Case Complexity = O(r)
+        """
+        if runs not in self.index:
+            stack = Stack(self, runs, len(self.stacks))
+            self.stacks.append(stack)
+            self.index[runs] = stack
+        return self.index[runs]
+
+    def __len__(self) -> int:
+        return len(self.stacks)
+
+
+class StackCell(LayerStore):
+    """
+    A square of a SharedStackGrid, behaving like an AdditiveLayerStore.
+    Changes are written straight through to the grid.
+    """
+
+    __slots__ = ("grid", "x", "y")
+
+    def __init__(self, grid: SharedStackGrid, x: int, y: int) -> None:
+        super().__init__()
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    @property
+    def stack(self) -> Stack:
+        return self.grid.stack_at(self.x, self.y)
+
+    @property
+    def layers(self) -> list[Layer]:
+        return [layer for layer, count in self.stack.layer_runs() for _ in range(count)]
+
+    def add(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        return self.grid.add(self.x, self.y, layer)
+
+    def erase(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        return self.grid.erase(self.x, self.y, layer)
+
+    def special(self):
+        """
+        Reverse this square only.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        self.grid.set_stack(self.x, self.y, self.stack.reverse())
+
+    def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        return self.stack.get_pipeline()(start, timestamp, x, y)
+
+    def is_animated(self) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        return self.stack.animated
+
+    def copy(self) -> AdditiveLayerStore:
+        """
+        Returns a standalone AdditiveLayerStore with the same layers.
+        Best-Case Complexity = O(r)
+        Worst-Case Complexity = O(r)
+        """
+        store = AdditiveLayerStore()
+        for layer, count in self.stack.layer_runs():
+            store.runs.append(LayerRun(layer, count))
+            store.depth += count
+        return store
+
+
+class SharedStackGrid(Grid):
+    """
+    An ADD grid where every square refers to an interned Stack, by its id
+    in the int32 array `stack_ids`. Squares painted by the same strokes share
+    one stack, so memory and per-frame work scale with the distinct stacks:
+    rendering evaluates each stack once for all its squares, and just once
+    in total if it does not read the position.
+
+    Stacks no square refers to any more are dropped by compact, which runs
+    whenever the table has grown to COMPACT_FACTOR times its last live size.
+
+    Special only toggles reverse_pending, so pairs of specials cancel for free.
+    An odd pending special is applied the next time the stacks are used, see
+    settle. `stack_ids` is only up to date after settle.
+    """
+
+    COMPACT_MIN = 1024
+    COMPACT_FACTOR = 4
+
+    def __init__(self, x, y) -> None:
+        super().__init__(Grid.DRAW_STYLE_ADD, x, y)
+
+    def initialize(self, x, y):
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        self.x = x
+        self.y = y
+        self.table = StackTable()
+        self.live_stacks = 1
+        self.stack_ids = np.zeros((x, y), dtype=np.int32)
+        self.reverse_pending = False
+        self.colors = np.zeros((x, y, 3), dtype=np.uint8)
+        self.dirty = np.ones((x, y), dtype=bool)
+        self.animated = np.zeros((x, y), dtype=bool)
+        self.rendered_background = None
+
+    def stack_at(self, x, y) -> Stack:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y*log(x*y) + u*r), settling a pending special
+        """
+        self.settle()
+        return self.table.stacks[self.stack_ids[x, y]]
+
+    def set_stack(self, x, y, stack: Stack) -> bool:
+        """
+        Make the square at (x, y) hold stack.
+        Returns true if the square was actually changed.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y), when compacting, amortised O(1)
+        """
+        self.settle()
+        if self.stack_ids[x, y] == stack.id:
+            return False
+        self.stack_ids[x, y] = stack.id
+        self.dirty[x, y] = True
+        self.maybe_compact()
+        return True
+
+    def peek(self, x, y) -> StackCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def store(self, x, y) -> StackCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if not (0 <= x < self.x and 0 <= y < self.y):
+            raise IndexError("Grid square out of range.")
+        return StackCell(self, x, y)
+
+    def square(self, x, y) -> StackCell:
+        """
+        The views of the squares write through already.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def push(self, stack: Stack, layer: Layer) -> Stack:
+        """
+        stack with layer added, unless it already holds AdditiveLayerStore.MAX_DEPTH layers.
+        """
+        if AdditiveLayerStore.MAX_DEPTH is not None and stack.depth >= AdditiveLayerStore.MAX_DEPTH:
+            return stack
+        return stack.push(layer)
+
+    def add(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r), for a stack not seen before
+        """
+        return self.set_stack(x, y, self.push(self.stack_at(x, y), layer))
+
+    def erase(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r), for a stack not seen before
+        """
+        return self.set_stack(x, y, self.stack_at(x, y).serve())
+
+    def transition_many(self, xs, ys, transition) -> np.ndarray:
+        """
+        Replace the stack of each square (xs[i], ys[i]) by transition(stack),
+        working out each distinct transition once.
+        Returns a bool array of which squares were actually changed.
+        """
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk + u*r), u being the number of distinct stacks
+        """
+        self.settle()
+        ids = self.stack_ids[xs, ys]
+        unique, inverse = np.unique(ids, return_inverse=True)
+        targets = np.array([transition(self.table.stacks[i]).id for i in unique.tolist()], dtype=np.int32)
+        new_ids = targets[inverse.reshape(-1)]
+        changed = new_ids != ids
+        xs, ys = np.asarray(xs)[changed], np.asarray(ys)[changed]
+        self.stack_ids[xs, ys] = new_ids[changed]
+        self.dirty[xs, ys] = True
+        self.maybe_compact()
+        return changed
+
+    @in_sequence
+    def add_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk + u*r)
+        """
+        return self.transition_many(xs, ys, lambda stack: self.push(stack, layer))
+
+    @in_sequence
+    def erase_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk + u*r)
+        """
+        return self.transition_many(xs, ys, Stack.serve)
+
+    def special(self):
+        """
+        Reverse every stack. Palindromic stacks, such as single runs, are unchanged.
+        Reversing twice changes nothing, so this only flips the pending parity.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.reverse_pending = not self.reverse_pending
+
+    def settle(self):
+        """
+        Reverse every stack if an odd number of specials is pending.
+        Best-Case Complexity = O(1), when none is
+        Worst-Case Complexity = O(x*y*log(x*y) + u*r)
+        """
+        if not self.reverse_pending:
+            return
+        self.reverse_pending = False
+        painted_x, painted_y = np.nonzero(self.stack_ids)
+        self.transition_many(painted_x, painted_y, Stack.reverse)
+
+    def maybe_compact(self):
+        """
+        Compact the stack table if it has grown enough since the last time.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y), amortised over the stacks created since
+        """
+        if len(self.table) > max(self.COMPACT_MIN, self.COMPACT_FACTOR * self.live_stacks):
+            self.compact()
+
+    def compact(self):
+        """
+        Drop the stacks no square holds, renumbering the rest.
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y*log(x*y) + u*r)
+        """
+        self.settle()
+        live = np.unique(self.stack_ids)
+        table = StackTable()
+        mapping = np.zeros(len(self.table), dtype=np.int32)
+        for stack_id in live.tolist():
+            stack = table.intern(self.table.stacks[stack_id].runs)
+            stack.pipeline = self.table.stacks[stack_id].pipeline
+            mapping[stack_id] = stack.id
+        self.stack_ids = mapping[self.stack_ids]
+        self.table = table
+        self.live_stacks = len(table)
+
+    def render(self, timestamp, background) -> np.ndarray:
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y*n), n being the length of the longest chain
+        """
+        self.settle()
+        background = tuple(background)
+        if background != self.rendered_background:
+            self.rendered_background = background
+            self.dirty[:] = True
+        stale_x, stale_y = np.nonzero(self.dirty | self.animated)
+        for stack_id, cells in group_by(self.stack_ids[stale_x, stale_y]):
+            xs, ys = stale_x[cells], stale_y[cells]
+            stack = self.table.stacks[stack_id]
+            self.animated[xs, ys] = stack.animated
+            self.colors[xs, ys] = render_pipeline(stack.get_pipeline(), background, timestamp, xs, ys)
+        self.dirty[:] = False
+        return self.colors.copy()
+
+
+class CSRCell(LayerStore):
+    """
+    A square of a CSRAddGrid, behaving like an AdditiveLayerStore.
+    Changes are written straight through to the grid.
+    """
+
+    __slots__ = ("grid", "x", "y")
+
+    def __init__(self, grid: CSRAddGrid, x: int, y: int) -> None:
+        super().__init__()
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    @property
+    def layers(self) -> list[Layer]:
+        return self.grid.layers_at(self.x, self.y)
+
+    def add(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(d), d being the depth, when moving the square
+        """
+        return self.grid.add(self.x, self.y, layer)
+
+    def erase(self, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.grid.erase(self.x, self.y, layer)
+
+    def special(self):
+        """
+        Reverse this square only.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.grid.settle()
+        self.grid.reversed[self.x, self.y] = not self.grid.reversed[self.x, self.y]
+        self.grid.mark_dirty(self.x, self.y)
+
+    def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
+        """
+        Best-Case Complexity = O(1), when the chain is cached
+        Worst-Case Complexity = O(d*256)
+        """
+        return self.grid.get_pipeline(self.x, self.y)(start, timestamp, x, y)
+
+    def is_animated(self) -> bool:
+        """
+        Best-Case Complexity = O(1), when the chain is cached
+        Worst-Case Complexity = O(d*256)
+        """
+        return self.grid.get_pipeline(self.x, self.y).animated
+
+    def copy(self) -> AdditiveLayerStore:
+        """
+        Returns a standalone AdditiveLayerStore with the same layers.
+        Best-Case Complexity = O(d)
+        Worst-Case Complexity = O(d)
+        """
+        store = AdditiveLayerStore()
+        for layer in self.layers:
+            store.add(layer)
+        return store
+
+
+class CSRAddGrid(Grid):
+    """
+    An ADD grid storing the layers of all squares in one flat uint8 array,
+    `data`, in compressed sparse row form. Square (x, y) owns the slot of
+    capacity[x, y] entries starting at offset[x, y], holding its length[x, y]
+    layer indices at the start of the slot, in reverse order if reversed[x, y].
+
+    Erasing from the front shrinks the slot, special just flips `reversed`,
+    and only when next used, so pairs of specials cancel for free, see settle.
+    The compiled chains of squares read through their views are cached in
+    `pipelines`, and dropped by mark_dirty whenever the square changes.
+
+    Squares which outgrow their slot, or add to a reversed stack, move to a
+    new slot twice the size at the end of data. The entries left behind are
+    reclaimed by compact, once they make up half of data.
+
+    Rendering runs depth level by depth level over all stale squares at once,
+    applying the batch kernel of each layer to the squares with that layer
+    at that level, from the last layer ignoring its input colour onwards.
+    """
+
+    MIN_SLOT = 4
+    COMPACT_MIN = 1 << 16
+
+    def __init__(self, x, y) -> None:
+        super().__init__(Grid.DRAW_STYLE_ADD, x, y)
+
+    def initialize(self, x, y):
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y)
+        """
+        self.x = x
+        self.y = y
+        self.data = np.zeros(self.MIN_SLOT, dtype=np.uint8)
+        self.used = 0   # Entries of data handed out to slots
+        self.garbage = 0   # Entries of data no slot owns any more
+        self.offset = np.zeros((x, y), dtype=np.int64)
+        self.length = np.zeros((x, y), dtype=np.int32)
+        self.capacity = np.zeros((x, y), dtype=np.int32)
+        self.reversed = np.zeros((x, y), dtype=bool)
+        self.reverse_pending = False
+        self.pipelines = {}   # (x, y) -> compiled chain, see get_pipeline
+        self.colors = np.zeros((x, y, 3), dtype=np.uint8)
+        self.dirty = np.ones((x, y), dtype=bool)
+        self.animated = np.zeros((x, y), dtype=bool)
+        self.rendered_background = None
+
+    def mark_dirty(self, x, y):
+        """
+        Recompute the colour of the square, or squares, at (x, y) on the next
+        render, and drop their cached compiled chains.
+        Best-Case Complexity = O(1), when no chain is cached
+        Worst-Case Complexity = O(k), k being the number of squares
+        """
+        self.dirty[x, y] = True
+        if self.pipelines:
+            for key in zip(np.atleast_1d(x).tolist(), np.atleast_1d(y).tolist()):
+                self.pipelines.pop(key, None)
+
+    def get_pipeline(self, x, y) -> function:
+        """
+        The layers of the square at (x, y) compiled into one callable, see compile_chain.
+        Cached until the square next changes, as Stack.get_pipeline.
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(d*256), d being the depth
+        """
+        self.settle()
+        pipeline = self.pipelines.get((x, y))
+        if pipeline is None:
+            pipeline = compile_chain(self.layers_at(x, y))
+            self.pipelines[(x, y)] = pipeline
+        return pipeline
+
+    def positions(self, xs, ys, levels) -> np.ndarray:
+        """
+        Positions in data of the layer at depth levels[i] of square (xs[i], ys[i]).
+        Best-Case Complexity = O(k)
+        Worst-Case Complexity = O(k)
+        """
+        lengths = self.length[xs, ys]
+        return self.offset[xs, ys] + np.where(self.reversed[xs, ys], lengths - 1 - levels, levels)
+
+    def gather(self, xs, ys) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every layer of the squares (xs[i], ys[i]), as the arrays
+        (square i, depth level, position in data).
+        Best-Case Complexity = O(k + d), d being the total depth
+        Worst-Case Complexity = O(k + d)
+        """
+        lengths = self.length[xs, ys].astype(np.int64)
+        cells = np.repeat(np.arange(len(lengths)), lengths)
+        levels = np.arange(len(cells)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return cells, levels, self.positions(xs[cells], ys[cells], levels)
+
+    def reserve(self, size: int):
+        """
+        Grow data, by doubling, to hold at least size entries.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(size)
+        """
+        if size > len(self.data):
+            data = np.zeros(max(size, 2 * len(self.data)), dtype=np.uint8)
+            data[:self.used] = self.data[:self.used]
+            self.data = data
+
+    def relocate(self, xs, ys, capacities):
+        """
+        Move the squares (xs[i], ys[i]) to new slots of capacities[i] at the end
+        of data, with their layers in order, no longer reversed.
+        Best-Case Complexity = O(k + c), c being the total new capacity
+        Worst-Case Complexity = O(k + c)
+        """
+        capacities = np.asarray(capacities, dtype=np.int64)
+        offsets = self.used + np.cumsum(capacities) - capacities
+        self.reserve(self.used + int(capacities.sum()))
+        cells, levels, positions = self.gather(xs, ys)
+        self.data[offsets[cells] + levels] = self.data[positions]
+        self.garbage += int(self.capacity[xs, ys].sum())
+        self.used += int(capacities.sum())
+        self.offset[xs, ys] = offsets
+        self.capacity[xs, ys] = capacities
+        self.reversed[xs, ys] = False
+
+    def compact(self):
+        """
+        Move every square to a tight slot at the start of a new data array.
+        Best-Case Complexity = O(x*y + d), d being the total depth
+        Worst-Case Complexity = O(x*y + d)
+        """
+        self.settle()
+        painted_x, painted_y = np.nonzero(self.length)
+        lengths = self.length[painted_x, painted_y].astype(np.int64)
+        offsets = np.cumsum(lengths) - lengths
+        cells, levels, positions = self.gather(painted_x, painted_y)
+        data = np.zeros(max(self.MIN_SLOT, int(lengths.sum()) * 3 // 2), dtype=np.uint8)
+        data[offsets[cells] + levels] = self.data[positions]
+        self.data = data
+        self.used = int(lengths.sum())
+        self.garbage = 0
+        self.offset[:] = 0
+        self.capacity[:] = 0
+        self.reversed[:] = False
+        self.offset[painted_x, painted_y] = offsets
+        self.capacity[painted_x, painted_y] = lengths
+
+    def maybe_compact(self):
+        """
+        Compact data once more than half of it is garbage.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(x*y + d), amortised over the garbage created since
+        """
+        if self.garbage > max(self.COMPACT_MIN, self.used // 2):
+            self.compact()
+
+    def layers_at(self, x, y) -> list[Layer]:
+        """
+        The layers of the square at (x, y), in the order they are applied.
+        Best-Case Complexity = O(d)
+        Worst-Case Complexity = O(d)
+        """
+        self.settle()
+        layers = get_layers()
+        levels = np.arange(self.length[x, y])
+        positions = self.positions(np.full(len(levels), x), np.full(len(levels), y), levels)
+        return [layers[index] for index in self.data[positions].tolist()]
+
+    def peek(self, x, y) -> CSRCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def store(self, x, y) -> CSRCell:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if not (0 <= x < self.x and 0 <= y < self.y):
+            raise IndexError("Grid square out of range.")
+        return CSRCell(self, x, y)
+
+    def square(self, x, y) -> CSRCell:
+        """
+        The views of the squares write through already.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.store(x, y)
+
+    def add(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(d), when moving the square
+        """
+        self.settle()
+        length = int(self.length[x, y])
+        if AdditiveLayerStore.MAX_DEPTH is not None and length >= AdditiveLayerStore.MAX_DEPTH:
+            return False
+        if length == 0:
+            self.reversed[x, y] = False
+        if self.reversed[x, y] or length >= self.capacity[x, y]:
+            self.relocate(np.array([x]), np.array([y]), [max(self.MIN_SLOT, 2 * length)])
+        self.data[self.offset[x, y] + length] = layer.index
+        self.length[x, y] = length + 1
+        self.mark_dirty(x, y)
+        self.maybe_compact()
+        return True
+
+    def erase(self, x, y, layer: Layer) -> bool:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.settle()
+        if self.length[x, y] == 0:
+            return False
+        # The front of a reversed square is the end of its slot
+        if not self.reversed[x, y]:
+            self.offset[x, y] += 1
+            self.capacity[x, y] -= 1
+            self.garbage += 1
+        self.length[x, y] -= 1
+        self.mark_dirty(x, y)
+        self.maybe_compact()
+        return True
+
+    @in_sequence
+    def add_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk + d), d being the total depth of squares moved
+        """
+        self.settle()
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        changed = np.ones(len(xs), dtype=bool)
+        if AdditiveLayerStore.MAX_DEPTH is not None:
+            changed = self.length[xs, ys] < AdditiveLayerStore.MAX_DEPTH
+        xs, ys = xs[changed], ys[changed]
+        lengths = self.length[xs, ys]
+        self.reversed[xs[lengths == 0], ys[lengths == 0]] = False
+        move = self.reversed[xs, ys] | (lengths >= self.capacity[xs, ys])
+        if move.any():
+            self.relocate(xs[move], ys[move], np.maximum(self.MIN_SLOT, 2 * lengths[move]))
+        self.data[self.offset[xs, ys] + lengths] = layer.index
+        self.length[xs, ys] += 1
+        self.mark_dirty(xs, ys)
+        self.maybe_compact()
+        return changed
+
+    @in_sequence
+    def erase_many(self, xs, ys, layer: Layer) -> np.ndarray:
+        """
+        Best-Case Complexity = O(k*logk), k being the number of squares
+        Worst-Case Complexity = O(k*logk)
+        """
+        self.settle()
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        changed = self.length[xs, ys] > 0
+        xs, ys = xs[changed], ys[changed]
+        # The front of a reversed square is the end of its slot
+        front = ~self.reversed[xs, ys]
+        self.offset[xs[front], ys[front]] += 1
+        self.capacity[xs[front], ys[front]] -= 1
+        self.garbage += int(front.sum())
+        self.length[xs, ys] -= 1
+        self.mark_dirty(xs, ys)
+        self.maybe_compact()
+        return changed
+
+    def special(self):
+        """
+        Reverse every stack.
+        Reversing twice changes nothing, so this only flips the pending parity.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.reverse_pending = not self.reverse_pending
+
+    def settle(self):
+        """
+        Reverse every stack if an odd number of specials is pending.
+        Best-Case Complexity = O(1), when none is
+        Worst-Case Complexity = O(x*y)
+        """
+        if not self.reverse_pending:
+            return
+        self.reverse_pending = False
+        np.logical_not(self.reversed, out=self.reversed)
+        self.pipelines.clear()
+        self.mark_dirty(*np.nonzero(self.length > 1))
+
+    def render(self, timestamp, background) -> np.ndarray:
+        """
+        Best-Case Complexity = O(x*y)
+        Worst-Case Complexity = O(x*y + d*l), d being the total depth of stale squares
+        and l the number of layers
+        """
+        self.settle()
+        background = tuple(background)
+        if background != self.rendered_background:
+            self.rendered_background = background
+            self.dirty[:] = True
+        stale_x, stale_y = np.nonzero(self.dirty | self.animated)
+        # Deepest squares first, so the squares deeper than a level are a prefix
+        order = np.argsort(-self.length[stale_x, stale_y], kind="stable")
+        stale_x, stale_y = stale_x[order], stale_y[order]
+        lengths = self.length[stale_x, stale_y]
+        depth = int(lengths[0]) if len(lengths) > 0 else 0
+        active = [int(np.count_nonzero(lengths > level)) for level in range(depth)]
+        layers = registered_layers()
+        reads_color = np.zeros(len(get_layers()), dtype=bool)
+        animated = np.zeros(len(get_layers()), dtype=bool)
+        for layer in layers:
+            reads_color[layer.index] = "color" in layer.reads
+            animated[layer.index] = layer.animated
+
+        # Each square starts from its last layer ignoring the input colour
+        start = np.zeros(len(stale_x), dtype=np.int64)
+        for level in range(depth):
+            n = active[level]
+            indices = self.data[self.positions(stale_x[:n], stale_y[:n], level)]
+            start[:n][~reads_color[indices]] = level
+        colors = np.empty((len(stale_x), 3), dtype=COLOR_DTYPE)
+        colors[:] = background
+        is_animated = np.zeros(len(stale_x), dtype=bool)
+        for level in range(depth):
+            n = active[level]
+            indices = self.data[self.positions(stale_x[:n], stale_y[:n], level)].astype(np.int64)
+            applies = start[:n] <= level
+            is_animated[:n] |= applies & animated[indices]
+            for index, rows in group_by(np.where(applies, indices, -1)):
+                if index < 0:
+                    continue
+                colors[rows] = get_layers()[index].apply_batch(colors[rows], timestamp, stale_x[rows], stale_y[rows])
+        self.colors[stale_x, stale_y] = colors
+        self.animated[stale_x, stale_y] = is_animated
+        self.dirty[:] = False
+        return self.colors.copy()
+
+
+def make_grid(draw_style, x, y) -> Grid:
+    """
+    A grid for this draw style, using an array backend where there is one.
+    ADD grids use CSRAddGrid, whose render cost does not depend on how many
+    distinct stacks there are, SharedStackGrid suits canvases of few distinct stacks.
+    """
+    if draw_style == Grid.DRAW_STYLE_SET:
+        return IndexSetGrid(x, y)
+    if draw_style == Grid.DRAW_STYLE_ADD:
+        return CSRAddGrid(x, y)
+    if draw_style == Grid.DRAW_STYLE_SEQUENCE:
+        return MaskSequenceGrid(x, y)
+    return Grid(draw_style, x, y)
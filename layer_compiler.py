@@ -0,0 +1,291 @@
+# @File: layer_compiler.py
+# @Author: Aoran Li
+# @Last Edit Date: 2026-10-16
+
+"""
+Fuses a sequence of layers into a single callable.
+
+Runs of channelwise, colour-only layers (lighten, darken, invert, ...)
+are tabulated into one 256-entry lookup table per channel and composed,
+so 40 stacked lightens cost a single lookup, and invert∘invert disappears.
+PartialChain additionally caches everything before the first animated layer,
+and mask_pipeline keeps one compiled chain per SEQUENCE style layer mask.
+
+Chains may also be given as runs, (layer, count) pairs meaning the layer
+applied count times in a row. Runs are applied in closed form where the layer
+allows it: layers ignoring their input colour once, tabulable layers as a
+power of their lookup table, computed by repeated squaring.
+"""
+
+from __future__ import annotations
+import functools
+import numpy as np
+from layer_util import COLOR_DTYPE, Layer, fold_chain, get_layers
+
+IDENTITY = tuple(range(256))
+# Most lookup tables kept by each of the caches below, least recently used dropped first
+LUT_CACHE_SIZE = 1024
+_luts = {}   # layer index -> (layer, lut), for registered layers only
+
+def is_tabulable(layer: Layer) -> bool:
+    """Whether a layer can be replaced by a per-channel lookup table."""
+    return layer.channelwise and layer.reads == frozenset(("color",))
+
+def layer_lut(layer: Layer) -> tuple[tuple[int, ...], tuple[int, ...], tuple[int, ...]]:
+    """
+    The per-channel lookup tables of a tabulable layer, cached per registered layer.
+    Best-Case Complexity = O(1), when cached
+    Worst-Case Complexity = O(256)
+    """
+    cached = _luts.get(layer.index)
+    if cached is not None and cached[0] is layer:
+        return cached[1]
+    outputs = [layer.apply((i, i, i), 0, 0, 0) for i in range(256)]
+    lut = intern_lut(tuple(tuple(out[c] for out in outputs) for c in range(3)))
+    layers = get_layers()
+    if 0 <= layer.index < len(layers) and layers[layer.index] is layer:
+        _luts[layer.index] = (layer, lut)
+    return lut
+
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def intern_lut(lut):
+    """
+    The canonical object equal to this lookup table, among those recently used,
+    so chains needing equal tables share one.
+    Best-Case Complexity = O(256), hashing the table
+    Worst-Case Complexity = O(256)
+    """
+    return lut
+
+IDENTITY_LUT = intern_lut((IDENTITY, IDENTITY, IDENTITY))
+
+def then_layer(lut, layer: Layer):
+    """
+    Interned lookup tables doing `lut`, then the tabulable `layer`.
+    Best-Case Complexity = O(256)
+    Worst-Case Complexity = O(256)
+    """
+    return then_lut(lut, layer_lut(layer))
+
+def then_lut(first, second):
+    """
+    Interned lookup tables doing `first`, then `second`.
+    Best-Case Complexity = O(256)
+    Worst-Case Complexity = O(256)
+    """
+    return intern_lut(compose_luts(first, second))
+
+def power_lut(layer: Layer, count: int):
+    """
+    Interned lookup tables applying the tabulable `layer` count times,
+    by repeated squaring, so nothing is cached per count.
+    Best-Case Complexity = O(256)
+    Worst-Case Complexity = O(256*logcount)
+    """
+    result, square = IDENTITY_LUT, layer_lut(layer)
+    while count > 0:
+        if count & 1:
+            result = then_lut(result, square)
+        count >>= 1
+        if count > 0:
+            square = then_lut(square, square)
+    return result
+
+def compose_luts(first, second):
+    """
+    Lookup tables doing `first`, then `second`.
+    Best-Case Complexity = O(256)
+    Worst-Case Complexity = O(256)
+    """
+    return tuple(tuple(second[c][v] for v in first[c]) for c in range(3))
+
+def as_runs(layers) -> list[tuple[Layer, int]]:
+    """
+    Given layers or (layer, count) runs in the order they are applied, returns
+    the equivalent runs with those overwritten anyway folded away (see fold_chain),
+    neighbouring runs of the same layer merged, and runs of layers ignoring
+    their input colour cut down to a single application.
+    Best-Case Complexity = O(n)
+    Worst-Case Complexity = O(n)
+    """
+    runs = []
+    for item in layers:
+        layer, count = (item, 1) if isinstance(item, Layer) else item
+        if count <= 0:
+            continue
+        if "color" not in layer.reads:
+            runs = []
+            count = 1
+        if runs and runs[-1][0] is layer:
+            count += runs.pop()[1]
+        runs.append((layer, count))
+    return runs
+
+def unchanged(color, timestamp, x, y):
+    """The compiled empty chain."""
+    return color
+unchanged.steps = []
+unchanged.animated = False
+unchanged.positional = False
+
+def compile_chain(layers) -> function:
+    """
+    Compile layers, or runs, in the order they are applied, into one callable with
+    the same signature as Layer.apply. The compiled steps are kept on it as `.steps`,
+    each either a Layer or a per-channel lookup table, and whether any step
+    reads the timestamp or position as `.animated` and `.positional`.
+    """
+    """
+    Best-Case Complexity = O(n)
+    Worst-Case Complexity = O(n*256*logk), composing n new lookup tables of runs of length k,
+    or O(n*k) steps for runs of layers which cannot be tabulated
+    """
+    runs = as_runs(layers)
+    if len(runs) == 0:
+        return unchanged
+    steps = []
+    for layer, count in runs:
+        if not is_tabulable(layer):
+            steps.extend([layer] * count)
+        elif steps and not isinstance(steps[-1], Layer):
+            steps[-1] = then_lut(steps[-1], power_lut(layer, count))
+        else:
+            steps.append(power_lut(layer, count))
+    # Drop tables which cancelled out, such as invert∘invert
+    steps = [step for step in steps if step != IDENTITY_LUT]
+
+    if len(steps) == 0:
+        return unchanged
+    elif len(steps) == 1 and isinstance(steps[0], Layer):
+        apply = steps[0].apply
+        def fused(color, timestamp, x, y):
+            return apply(color, timestamp, x, y)
+    elif len(steps) == 1:
+        r, g, b = steps[0]
+        def fused(color, timestamp, x, y):
+            return (r[color[0]], g[color[1]], b[color[2]])
+    else:
+        def fused(color, timestamp, x, y):
+            for step in steps:
+                if isinstance(step, Layer):
+                    color = step.apply(color, timestamp, x, y)
+                else:
+                    color = (step[0][color[0]], step[1][color[1]], step[2][color[2]])
+            return color
+    fused.steps = steps
+    fused.animated = any(isinstance(step, Layer) and step.animated for step in steps)
+    fused.positional = any(isinstance(step, Layer) and step.positional for step in steps)
+    return fused
+
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def lut_array(lut) -> np.ndarray:
+    """
+    A lookup table as a read only (3, 256) numpy array, for the recently used tables.
+    Best-Case Complexity = O(256), hashing the table
+    Worst-Case Complexity = O(256)
+    """
+    table = np.array(lut, dtype=COLOR_DTYPE)
+    table.flags.writeable = False
+    return table
+
+def apply_steps(steps, colors, timestamp, xs, ys):
+    """
+    Apply compiled steps to a whole plane of colours at once, see Layer.apply_batch.
+    Best-Case Complexity = O(k*n), k being the number of colours
+    Worst-Case Complexity = O(k*n)
+    """
+    colors = np.asarray(colors, dtype=COLOR_DTYPE)
+    for step in steps:
+        if isinstance(step, Layer):
+            colors = step.apply_batch(colors, timestamp, xs, ys)
+        else:
+            table = lut_array(step)
+            colors = np.stack([table[c][colors[..., c]] for c in range(3)], axis=-1)
+    return colors
+
+# Layer masks have bit i set when the layer with index i is applied,
+# which is exactly the BSet of a SequenceLayerStore (item i+1 is bit i).
+_mask_chains = {}   # mask -> folded chain of the layers in the mask, in index order
+_mask_pipelines = {}   # mask -> compiled chain
+
+def mask_chain(mask: int) -> list[Layer]:
+    """
+    The layers of a mask which affect the colour, in the order they are applied.
+    Best-Case Complexity = O(1), when cached
+    Worst-Case Complexity = O(n)
+    """
+    mask = int(mask)
+    if mask not in _mask_chains:
+        layers = get_layers()
+        _mask_chains[mask] = fold_chain(
+            layers[i] for i in range(mask.bit_length()) if (mask >> i) & 1
+        )
+    return _mask_chains[mask]
+
+def mask_pipeline(mask: int) -> function:
+    """
+    The chain of a mask compiled into a single callable, see compile_chain.
+    This is a table of at most 2**n pipelines for n registered layers.
+    Best-Case Complexity = O(1), when cached
+    Worst-Case Complexity = O(n*256)
+    """
+    mask = int(mask)
+    if mask not in _mask_pipelines:
+        _mask_pipelines[mask] = compile_chain(mask_chain(mask))
+    return _mask_pipelines[mask]
+
+def render_pipeline(pipeline, background, timestamp, xs, ys) -> np.ndarray:
+    """
+    Colours of the squares (xs, ys), all starting from background, for a compiled chain.
+    Chains not reading the position are only evaluated once.
+    Best-Case Complexity = O(k), k being the number of squares
+    Worst-Case Complexity = O(k*n)
+    """
+    colors = np.empty((len(xs), 3), dtype=COLOR_DTYPE)
+    if not pipeline.positional:
+        colors[:] = pipeline(background, timestamp, 0, 0)
+        return colors
+    colors[:] = background
+    return apply_steps(pipeline.steps, colors, timestamp, xs, ys)
+
+
+class PartialChain:
+    """
+    A chain split at its first animated layer, called like Layer.apply.
+
+    The static prefix gives the same colour every frame, so its result is
+    cached for the last (start, x, y) seen, and each call only evaluates
+    the compiled suffix starting at the first animated layer.
+    """
+
+    def __init__(self, layers) -> None:
+        """
+        layers may be Layers or (layer, count) runs, as for compile_chain.
+        Best-Case Complexity = O(n)
+        Worst-Case Complexity = O(n*256)
+        """
+        chain = as_runs(layers)
+        split = len(chain)
+        for i, (layer, _) in enumerate(chain):
+            if layer.animated:
+                split = i
+                break
+        self.static = compile_chain(chain[:split])
+        self.dynamic = compile_chain(chain[split:])
+        self.key = None     # (start, x, y) of the cached prefix result
+        self.value = None   # Cached prefix result
+
+    def __call__(self, color, timestamp, x, y):
+        """
+        Best-Case Complexity = O(1), when only the cached prefix is needed
+        Worst-Case Complexity = O(n)
+        """
+        if len(self.static.steps) == 0:
+            return self.dynamic(color, timestamp, x, y)
+        key = (tuple(color), x, y)
+        if key != self.key:
+            self.key = key
+            self.value = self.static(color, timestamp, x, y)
+        if len(self.dynamic.steps) == 0:
+            return self.value
+        return self.dynamic(self.value, timestamp, x, y)
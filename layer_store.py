@@ -1,17 +1,21 @@
 # @File: layer_store.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-28
+# @Last Edit Date: 2026-10-16
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 from layer_util import Layer
 from own_data_structures import *
 from data_structures.array_sorted_list import *
 from data_structures.bset import *
 from layer_util import *
 from layers import invert
+from layer_compiler import PartialChain, as_runs, mask_chain
 
 class LayerStore(ABC):
+    # Stores are made for every painted square, so none of them keep a __dict__
+    __slots__ = ()
 
     def __init__(self) -> None:
         pass
@@ -46,6 +50,32 @@ class LayerStore(ABC):
         """
         pass
 
+    def apply_specials(self, count: int):
+        """
+        Apply special `count` times in a row.
+        Stores whose special is a toggle override this to skip pairs which cancel.
+        """
+        """
+        Best-Case Complexity = O(count*s), s being the cost of special
+        Worst-Case Complexity = O(count*s)
+        """
+        for _ in range(count):
+            self.special()
+
+    def is_animated(self) -> bool:
+        """
+        Returns true if the colour may change with the timestamp alone.
+        Stores which cannot tell should keep this default.
+        """
+        return True
+
+    @abstractmethod
+    def copy(self) -> LayerStore:
+        """
+        Returns an independent store with the same layers and mode.
+        """
+        pass
+
 class SetLayerStore(LayerStore):
     """
     Set layer store. A single layer can be stored at a time (or nothing at all)
@@ -54,6 +84,8 @@ class SetLayerStore(LayerStore):
     - special: Invert the colour output.
     """
 
+    __slots__ = ("layer", "mode")
+
     def __init__(self) -> None:
         super().__init__()
         self.layer = None   # Store Single Layer
@@ -120,18 +152,78 @@ class SetLayerStore(LayerStore):
         else:
             self.mode = True
 
+    def apply_specials(self, count: int):
+        """
+        Apply special `count` times in a row, inverting twice cancels out.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if count % 2 == 1:
+            self.special()
+
+    def is_animated(self) -> bool:
+        """
+        Returns true if the colour may change with the timestamp alone.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        return self.layer is not None and self.layer.animated
+
+    def copy(self) -> SetLayerStore:
+        """
+        Returns an independent store with the same layers and mode.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        store = SetLayerStore()
+        store.layer = self.layer
+        store.mode = self.mode
+        return store
+
+@dataclass(slots=True)
+class LayerRun:
+    """A layer applied count times in a row."""
+
+    layer: Layer
+    count: int = 1
+
 class AdditiveLayerStore(LayerStore):
     """
     Additive layer store. Each added layer applies after all previous ones.
     - add: Add a new layer to be added last.
     - erase: Remove the first layer that was added. Ignore what is currently selected.
     - special: Reverse the order of current layers (first becomes last, etc.)
+
+    Layers are stored run-length encoded, as a queue of LayerRuns, since dragging
+    a brush adds the same layer over and over again.
     """
 
+    # Most layers a single square can hold, or None for no limit.
+    # Set this to bound the memory of each square.
+    MAX_DEPTH = None
+    __slots__ = ("runs", "depth", "chain", "fused")
+
     def __init__(self) -> None:
         super().__init__()
-        self.layers = ArrayQueue(10)    # Create an ArrayQueue object to store the layer, 
-                                        # with an initial capacity of 10
+        # Create an ArrayQueue object to store the runs of layers,
+        # which only allocates storage once a layer is added
+        self.runs = ArrayQueue(0)
+        self.depth = 0   # Number of layers, over all runs
+        self.chain = None   # Cached layers which actually affect the colour, see get_chain
+        self.fused = None   # Cached compiled chain, see get_fused
+
+    @property
+    def layers(self) -> list[Layer]:
+        """
+        All layers, in the order they are applied.
+        Best-Case Complexity = O(d), d being the depth
+        Worst-Case Complexity = O(d)
+        """
+        return [run.layer for run in self.runs for _ in range(run.count)]
 
     def add(self, layer: Layer) -> bool:
         """
@@ -140,11 +232,16 @@ class AdditiveLayerStore(LayerStore):
         """
         """
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(n)
+        Worst-Case Complexity = O(r), r being the number of runs, when the queue resizes
         """
-        self.layers.append(layer)   # Add a new layer to the end of the queue
-        if len(self.layers) > self.layers.capacity:   # If the length of the queue is greater than the capacity
-            self.layers.capacity = len(self.layers)*100   # Increase the capacity of the queue
+        if self.MAX_DEPTH is not None and self.depth >= self.MAX_DEPTH:
+            return False   # The store already holds MAX_DEPTH layers
+        if len(self.runs) > 0 and self.runs[len(self.runs) - 1].layer is layer:
+            self.runs[len(self.runs) - 1].count += 1   # Extend the last run
+        else:
+            self.runs.append(LayerRun(layer))   # Add a new run to the end of the queue
+        self.depth += 1
+        self.invalidate()
         return True
         
     def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
@@ -153,18 +250,57 @@ class AdditiveLayerStore(LayerStore):
         """
         """
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(n)
+        Worst-Case Complexity = O(r)
         """
-        # If the queue is empty, return the starting color
-        if len(self.layers) == 0:
-            return start
-        else:
-            color = start
-            # Iterate through each layer in the queue and apply it to the color
-            for layer in self.layers:
-                color = layer.apply(color, timestamp, x, y)
-            return color
-        
+        return self.get_fused()(start, timestamp, x, y)
+
+    def get_runs(self) -> list[tuple[Layer, int]]:
+        """
+        Returns the (layer, count) runs to apply, with those overwritten by a later
+        layer ignoring its input colour (such as black) folded away, see as_runs.
+        Cached until the store is next changed.
+        """
+        """
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(r)
+        """
+        if self.chain is None:
+            self.chain = as_runs((run.layer, run.count) for run in self.runs)
+        return self.chain
+
+    def get_chain(self) -> list[Layer]:
+        """
+        Returns the layers to apply, with those overwritten by a later
+        layer ignoring its input colour (such as black) folded away.
+        """
+        """
+        Best-Case Complexity = O(r), when cached
+        Worst-Case Complexity = O(d)
+        """
+        return fold_chain(layer for layer, count in self.get_runs() for _ in range(count))
+
+    def get_fused(self) -> PartialChain:
+        """
+        Returns the runs compiled into a single callable, which also caches
+        the colour up to the first animated layer, see layer_compiler.
+        Cached until the store is next changed.
+        """
+        """
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(r*256*logd)
+        """
+        if self.fused is None:
+            self.fused = PartialChain(self.get_runs())
+        return self.fused
+
+    def invalidate(self):
+        """
+        Forget the cached chain, after the layers have changed.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.chain = None
+        self.fused = None
 
     def erase(self, layer: Layer) -> bool:
         """
@@ -173,13 +309,17 @@ class AdditiveLayerStore(LayerStore):
         """
         """
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(n)
+        Worst-Case Complexity = O(r), when the queue resizes
         """
-        if len(self.layers) == 0:   # If the queue is empty, return False
+        if self.depth == 0:   # If the queue is empty, return False
             return False
-        else:
-            self.layers.serve()   # Remove the first layer in the queue
-            return True
+        # Remove the first layer in the queue
+        self.runs[0].count -= 1
+        if self.runs[0].count == 0:
+            self.runs.serve()
+        self.depth -= 1
+        self.invalidate()
+        return True
         
     
     def special(self):
@@ -188,10 +328,47 @@ class AdditiveLayerStore(LayerStore):
         """
         """
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(n)
+        Worst-Case Complexity = O(r)
         """
-        self.layers.reverse()   # Reverse the order of the layers in the queue
-        
+        self.runs.reverse()   # Reverse the order of the runs in the queue
+        self.invalidate()
+
+    def apply_specials(self, count: int):
+        """
+        Apply special `count` times in a row, reversing twice cancels out.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        if count % 2 == 1:
+            self.special()
+
+    def is_animated(self) -> bool:
+        """
+        Returns true if the colour may change with the timestamp alone.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(r)
+        """
+        for layer, _ in self.get_runs():
+            if layer.animated:
+                return True
+        return False
+
+    def copy(self) -> AdditiveLayerStore:
+        """
+        Returns an independent store with the same layers and mode.
+        """
+        """
+        Best-Case Complexity = O(r)
+        Worst-Case Complexity = O(r)
+        """
+        store = AdditiveLayerStore()
+        for run in self.runs:
+            store.runs.append(LayerRun(run.layer, run.count))
+        store.depth = self.depth
+        return store
+
 class SequenceLayerStore(LayerStore):
     """
     Sequential layer store. Each layer type is either applied / not applied, and is applied in order of index.
@@ -202,9 +379,13 @@ class SequenceLayerStore(LayerStore):
         In the event of two layers being the median names, pick the lexicographically smaller one.
     """
 
+    __slots__ = ("layers", "chain", "fused")
+
     def __init__(self) -> None:
         super().__init__()
         self.layers = BSet(len(get_layers()))
+        self.chain = None   # Cached layers which actually affect the colour, see get_chain
+        self.fused = None   # Cached compiled chain, see get_fused
 
     def add(self, layer: Layer) -> bool:
         """
@@ -218,6 +399,7 @@ class SequenceLayerStore(LayerStore):
         # If the layer is not in the BSet, add it and return True
         if (layer.index + 1) not in self.layers:
             self.layers.add(layer.index + 1)
+            self.invalidate()
             return True
 
     def get_color(self, start, timestamp, x, y) -> tuple[int, int, int]:
@@ -228,14 +410,44 @@ class SequenceLayerStore(LayerStore):
         Best-Case Complexity = O(1)
         Worst-Case Complexity = O(logn)
         """
-        colour = start
-        if self.layers.is_empty():   # If the BSet is empty, return the starting color
-            return colour
-        # Iterate through each layer in the BSet and apply it to the color
-        for i in range(1, int.bit_length(self.layers.elems) + 1):   
-            if i in self.layers:
-                colour = get_layers().array[i - 1].apply(colour, timestamp, x, y)
-        return colour
+        return self.get_fused()(start, timestamp, x, y)
+
+    def get_chain(self) -> list[Layer]:
+        """
+        Returns the applied layers in index order, with those overwritten by a
+        later layer ignoring its input colour (such as black) folded away.
+        Cached until the store is next changed.
+        """
+        """
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(n)
+        """
+        if self.chain is None:
+            self.chain = mask_chain(self.layers.elems)
+        return self.chain
+
+    def get_fused(self) -> PartialChain:
+        """
+        Returns the chain compiled into a single callable, which also caches
+        the colour up to the first animated layer, see layer_compiler.
+        Cached until the store is next changed.
+        """
+        """
+        Best-Case Complexity = O(1), when cached
+        Worst-Case Complexity = O(n*256)
+        """
+        if self.fused is None:
+            self.fused = PartialChain(self.get_chain())
+        return self.fused
+
+    def invalidate(self):
+        """
+        Forget the cached chain, after the layers have changed.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        self.chain = None
+        self.fused = None
 
     def erase(self, layer: Layer) -> bool:
         """
@@ -250,6 +462,7 @@ class SequenceLayerStore(LayerStore):
             return False
         elif (layer.index + 1) in self.layers:   # If the layer is in the BSet, 
             self.layers.remove(layer.index + 1)  #remove it and return True
+            self.invalidate()
             return True
 
     def special(self):
@@ -278,4 +491,41 @@ class SequenceLayerStore(LayerStore):
             else:
                 value = special_layer[special_layer.__len__() // 2 - 1].value
             self.layers.remove(value.index + 1)
-            
\ No newline at end of file
+            self.invalidate()
+
+    def apply_specials(self, count: int):
+        """
+        Apply special `count` times in a row. Each removes a layer,
+        so once the store is empty the rest do nothing.
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(min(count, n)*n)
+        """
+        for _ in range(count):
+            if self.layers.is_empty():
+                break
+            self.special()
+
+    def is_animated(self) -> bool:
+        """
+        Returns true if the colour may change with the timestamp alone.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n)
+        """
+        for layer in self.get_chain():
+            if layer.animated:
+                return True
+        return False
+
+    def copy(self) -> SequenceLayerStore:
+        """
+        Returns an independent store with the same layers and mode.
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        store = SequenceLayerStore()
+        store.layers.elems = self.layers.elems
+        return store
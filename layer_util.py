@@ -6,24 +6,88 @@ No need to edit unless adding new features.
 
 from __future__ import annotations
 from dataclasses import dataclass, field
+import numpy as np
 from data_structures.referential_array import ArrayR
 
 LAYERS: ArrayR[Layer] = ArrayR(20)
+# Batch kernels work on planes of this dtype, wide enough to hold
+# intermediate results such as 255 + 40 before clamping.
+COLOR_DTYPE = np.int32
+# Everything a layer can read. Layers are assumed to read all of it unless declared otherwise.
+LAYER_INPUTS = frozenset(("color", "timestamp", "x", "y"))
 cur_layer_index = 0
 
-@dataclass
+@dataclass(slots=True)
 class Layer:
 
     index: int
     apply: function
     name: str = field(init=False)
     bg: tuple[int, int, int] | None = None
+    kernel: function | None = None
+    reads: frozenset[str] = LAYER_INPUTS
+    key: function | None = None
+    channelwise: bool = False
 
     def __post_init__(self):
         if hasattr(self.apply, "__bg__"):
             self.bg = self.apply.__bg__
+        if hasattr(self.apply, "__batch__"):
+            self.kernel = self.apply.__batch__
+        if hasattr(self.apply, "__reads__"):
+            self.reads, self.key = self.apply.__reads__
+        if hasattr(self.apply, "__channelwise__"):
+            self.channelwise = self.apply.__channelwise__
         self.name = self.apply.__name__
 
+    @property
+    def animated(self) -> bool:
+        """Whether the output can change with the timestamp alone."""
+        return "timestamp" in self.reads
+
+    @property
+    def constant(self) -> bool:
+        """Whether the output is the same for every input."""
+        return not self.reads
+
+    @property
+    def positional(self) -> bool:
+        """Whether the output depends on the position of the square."""
+        return "x" in self.reads or "y" in self.reads
+
+    def apply_batch(self, colors, timestamp, xs, ys):
+        """
+        Apply this layer to a whole plane of colours at once.
+
+        colors is an integer array of shape (..., 3), and xs / ys are
+        integer arrays broadcastable to colors[..., 0].
+        Returns a new array of the same shape as colors.
+
+        Layers without a batch kernel fall back to calling `apply`,
+        so the scalar version remains the reference. If the layer does not
+        read the colour, `apply` is only called once per distinct key
+        (or just once, if it does not read the position either).
+        """
+        colors = np.asarray(colors, dtype=COLOR_DTYPE)
+        xs, ys = np.broadcast_to(xs, colors.shape[:-1]), np.broadcast_to(ys, colors.shape[:-1])
+        if self.kernel is not None:
+            return self.kernel(colors, timestamp, xs, ys)
+        flat_colors = colors.reshape(-1, 3)
+        flat_xs, flat_ys = xs.reshape(-1), ys.reshape(-1)
+        if len(flat_colors) == 0:
+            return colors.copy()
+        if "color" not in self.reads and (not self.positional or self.key is not None):
+            # Evaluate once per equivalence class, then scatter the results.
+            keys = self.key(flat_xs, flat_ys) if self.positional else np.zeros(len(flat_xs), dtype=int)
+            _, cells, classes = np.unique(keys, return_index=True, return_inverse=True)
+        else:
+            cells = classes = np.arange(len(flat_colors))
+        results = np.array([
+            self.apply(tuple(int(c) for c in flat_colors[i]), timestamp, int(flat_xs[i]), int(flat_ys[i]))
+            for i in cells
+        ], dtype=colors.dtype)
+        return results[classes.reshape(-1)].reshape(colors.shape)
+
 class background(object):
     """Simple decorator to add a __bg__ property to a layer
 
@@ -43,6 +107,76 @@ class background(object):
         func.__bg__ = self.val
         return layer
 
+class reads(object):
+    """Simple decorator to declare which of LAYER_INPUTS a layer reads.
+
+    A layer which only depends on the position through some combination
+    of x and y can pass it as `key`. Squares with the same key are then
+    treated as equivalent, and the layer may be evaluated once for all of them.
+    The key must also work on numpy arrays of x and y.
+
+    Usage:  @register
+            @reads("timestamp", key=lambda x, y: x + y)
+            def my_special_layer(...):
+    """
+    def __init__(self, *inputs, key=None):
+        if not LAYER_INPUTS.issuperset(inputs):
+            raise ValueError(f"Layers can only read {sorted(LAYER_INPUTS)}.")
+        if key is not None:
+            inputs += ("x", "y")
+        self.val = (frozenset(inputs), key)
+
+    def __call__(self, layer: function|Layer):
+        # This could be applied before or after registration
+        if isinstance(layer, Layer):
+            layer.reads, layer.key = self.val
+            func = layer.apply
+        else:
+            func = layer
+        func.__reads__ = self.val
+        return layer
+
+class batch(object):
+    """Simple decorator to add a vectorised __batch__ kernel to a layer
+
+    The kernel has the signature kernel(colors, timestamp, xs, ys),
+    see Layer.apply_batch.
+
+    Usage:  @register
+            @batch(my_special_layer_kernel)
+            def my_special_layer(...):
+    """
+    def __init__(self, kernel):
+        self.kernel = kernel
+
+    def __call__(self, layer: function|Layer):
+        # This could be applied before or after registration
+        if isinstance(layer, Layer):
+            layer.kernel = self.kernel
+            func = layer.apply
+        else:
+            func = layer
+        func.__batch__ = self.kernel
+        return layer
+
+def channelwise(layer: function|Layer):
+    """Simple decorator to mark that each output channel of a layer only
+    depends on the same input channel, so it can be tabulated per channel.
+
+    Usage:  @register
+            @channelwise
+            @reads("color")
+            def my_special_layer(...):
+    """
+    # This could be applied before or after registration
+    if isinstance(layer, Layer):
+        layer.channelwise = True
+        func = layer.apply
+    else:
+        func = layer
+    func.__channelwise__ = True
+    return layer
+
 def register(func):
     """
     Layer register function.
@@ -58,6 +192,18 @@ def register(func):
     cur_layer_index += 1
     return LAYERS[cur_layer_index-1]
 
+def fold_chain(layers) -> list[Layer]:
+    """
+    Given layers in the order they are applied, drop those whose output is
+    overwritten anyway: everything before the last layer not reading the colour.
+    """
+    chain = []
+    for layer in layers:
+        if "color" not in layer.reads:
+            chain = []
+        chain.append(layer)
+    return chain
+
 def get_layers():
     import layers # Force all registrations to occur.
     return LAYERS
@@ -1,24 +1,65 @@
 """
 All layers are defined here.
+
+Each layer has a scalar version, apply(color, timestamp, x, y), and a
+vectorised batch kernel working on whole planes of colours at once
+(see Layer.apply_batch). The scalar version is the reference.
 """
 
 import colorsys
-from layer_util import background, register
+import numpy as np
+from layer_util import background, batch, channelwise, reads, register
+
+def _hls_channel(m1, m2, hue):
+    # Vectorised colorsys._v, keeping the same order of operations.
+    hue = hue % 1.0
+    return np.select(
+        [hue < 1/6, hue < 0.5, hue < 2/3],
+        [m1 + (m2-m1)*hue*6.0, m2, m1 + (m2-m1)*(2/3-hue)*6.0],
+        m1,
+    )
+
+def _rainbow_kernel(colors, timestamp, xs, ys):
+    h = (timestamp/20 + xs/20 + ys/20) % 1
+    l, s = 0.6, 0.6
+    m2 = l + s - (l*s)
+    m1 = 2.0*l - m2
+    rgb = np.stack([
+        _hls_channel(m1, m2, h + 1/3),
+        _hls_channel(m1, m2, h),
+        _hls_channel(m1, m2, h - 1/3),
+    ], axis=-1)
+    return (255*rgb).astype(colors.dtype)
 
 @register
+@reads("timestamp", key=lambda x, y: x + y)
+@batch(_rainbow_kernel)
 @background(200, 0, 120)
 def rainbow(color, timestamp, x, y):
-    return tuple(
-        int(255*x)
-        for x in colorsys.hls_to_rgb((timestamp/20 + x/20 + y/20)%1, 0.6, 0.6)
-    )
+    r, g, b = colorsys.hls_to_rgb((timestamp/20 + x/20 + y/20)%1, 0.6, 0.6)
+    return (int(255*r), int(255*g), int(255*b))
+
+def _constant_kernel(value):
+    def kernel(colors, timestamp, xs, ys):
+        out = np.empty_like(colors)
+        out[...] = value
+        return out
+    return kernel
 
 @register
+@reads()
+@batch(_constant_kernel((0, 0, 0)))
 @background(170, 170, 170)
 def black(color, timestamp, x, y):
     return (0, 0, 0)
 
+def _lighten_kernel(colors, timestamp, xs, ys):
+    return np.minimum(255, colors + 40)
+
 @register
+@channelwise
+@reads("color")
+@batch(_lighten_kernel)
 @background(240, 240, 240)
 def lighten(color, timestamp, x, y):
     return tuple(
@@ -26,7 +67,13 @@ def lighten(color, timestamp, x, y):
         for x in color
     )
 
+def _invert_kernel(colors, timestamp, xs, ys):
+    return 255 - colors
+
 @register
+@channelwise
+@reads("color")
+@batch(_invert_kernel)
 @background(0, 255, 255)
 def invert(color, timestamp, x, y):
     return tuple(
@@ -35,37 +82,89 @@ def invert(color, timestamp, x, y):
     )
 
 @register
+@reads()
+@batch(_constant_kernel((255, 0, 0)))
 @background(255, 0, 0)
 def red(color, timestamp, x, y):
     return (255, 0, 0)
 
 @register
+@reads()
+@batch(_constant_kernel((0, 255, 0)))
 @background(0, 255, 0)
 def green(color, timestamp, x, y):
     return (0, 255, 0)
 
 @register
+@reads()
+@batch(_constant_kernel((0, 0, 255)))
 @background(0, 0, 255)
 def blue(color, timestamp, x, y):
     return (0, 0, 255)
 
+def _darken_kernel(colors, timestamp, xs, ys):
+    return np.maximum(0, colors - 40)
+
+# Sparkle uses a linear congruential generator, x -> (a*x + c) % m.
+# Taking k steps is itself an LCG step, x -> (a_k*x + c_k) % m, so
+# LCG_JUMP[k] = (a_k, c_k) jumps ahead k steps at once.
+LCG_MULTIPLIER = 1103515245
+LCG_INCREMENT = 12345
+LCG_MODULUS = 1 << 31
+SPARKLE_MAX_STEPS = 10 + 16
+
+def _lcg_jump_table(max_steps):
+    table = [(1, 0)]
+    for _ in range(max_steps):
+        a, c = table[-1]
+        table.append(((LCG_MULTIPLIER * a) % LCG_MODULUS, (LCG_MULTIPLIER * c + LCG_INCREMENT) % LCG_MODULUS))
+    return table
+
+LCG_JUMP = _lcg_jump_table(SPARKLE_MAX_STEPS)
+_LCG_JUMP_ARRAY = np.array(LCG_JUMP, dtype=np.int64)
+
+def sparkle_bright(timestamp, x, y) -> bool:
+    """
+    Whether sparkle lightens (rather than darkens) the square at this time.
+    Jumping ahead is O(1), so nothing is cached per square.
+    """
+    step = int((timestamp + x/3 + y/5) * 3)
+    a, c = LCG_JUMP[10 + (step * 31 % 17)]
+    other = (a * x + c) % LCG_MODULUS
+    other += y
+    other = (a * other + c) % LCG_MODULUS
+    other = (other & ((1 << 31)-1)) >> 16
+    return other/(1 << 15) < 0.1
+
+def sparkle_mask(timestamp, xs, ys) -> np.ndarray:
+    """sparkle_bright for whole arrays of positions at once."""
+    xs = np.asarray(xs, dtype=np.int64)
+    ys = np.asarray(ys, dtype=np.int64)
+    steps = np.trunc((timestamp + xs/3 + ys/5) * 3).astype(np.int64)
+    jump = _LCG_JUMP_ARRAY[10 + (steps * 31 % 17)]
+    a, c = jump[..., 0], jump[..., 1]
+    other = (a * xs + c) % LCG_MODULUS
+    other = (a * (other + ys) + c) % LCG_MODULUS
+    other = (other & ((1 << 31)-1)) >> 16
+    return other/(1 << 15) < 0.1
+
+def _sparkle_kernel(colors, timestamp, xs, ys):
+    bright = sparkle_mask(timestamp, xs, ys)[..., np.newaxis]
+    return np.where(bright, _lighten_kernel(colors, timestamp, xs, ys), _darken_kernel(colors, timestamp, xs, ys))
+
 @register
+@reads("color", "timestamp", "x", "y")
+@batch(_sparkle_kernel)
 @background(100, 170, 255)
 def sparkle(color, timestamp, x, y):
-    ts = int((timestamp + x/3 + y/5) * 3)
-    other = x
-    for _ in range(10 + (ts * 31 % 17)):
-        other = (1103515245 * other + 12345) % (1 << 31)
-    other += y
-    for _ in range(10 + (ts * 31 % 17)):
-        other = (1103515245 * other + 12345) % (1 << 31)
-    ts = int((timestamp + x/10 + y/20) * 3)
-    other = (other & ((1 << 31)-1)) >> 16
-    if other/(1 << 15) < 0.1:
+    if sparkle_bright(timestamp, x, y):
         return lighten.apply(color, timestamp, x, y)
     return darken.apply(color, timestamp, x, y)
 
 @register
+@channelwise
+@reads("color")
+@batch(_darken_kernel)
 @background(30, 30, 30)
 def darken(color, timestamp, x, y):
     return tuple(
@@ -1,11 +1,14 @@
 # @File: main.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-31
+# @Last Edit Date: 2026-10-16
 
 import arcade
 import arcade.key as keys
-import math
+import numpy as np
 from grid import Grid
+from grid_backends import make_grid
+from brushes import sweep_cells
+from framebuffer import GridFramebuffer
 from layer_util import get_layers, Layer
 from layers import lighten
 from action import *
@@ -27,6 +30,35 @@ class MyWindow(arcade.Window):
 
     BG = [255, 255, 255]
 
+    # Draw the grid as one texture, rather than one rectangle per square.
+    TEXTURE_GRID = True
+    # Use the array backed grids of grid_backends where there is one for the draw style.
+    COMPACT_GRID = True
+    # Most bytes of undo history, and of replay actions, kept in memory, and whether
+    # older ones are spilled to disk. Replay is only bounded when spilling.
+    UNDO_BUDGET = 64 * 1024 * 1024
+    UNDO_SPILL = True
+
+    GRID_VERTEX_SHADER = """
+    #version 330
+    in vec2 in_vert;
+    in vec2 in_uv;
+    out vec2 uv;
+    void main() {
+        gl_Position = vec4(in_vert, 0.0, 1.0);
+        uv = in_uv;
+    }
+    """
+    GRID_FRAGMENT_SHADER = """
+    #version 330
+    uniform sampler2D grid_texture;
+    in vec2 uv;
+    out vec4 fragColor;
+    void main() {
+        fragColor = texture(grid_texture, uv);
+    }
+    """
+
     # SCAFFOLD PART
     # Unless you're adding new features, you shouldn't need to touch this.
 
@@ -44,15 +76,22 @@ class MyWindow(arcade.Window):
         self.replay_timer = 0
         self.on_init()
 
+    def make_grid(self) -> Grid:
+        """A new, empty grid for the current draw style."""
+        if self.COMPACT_GRID:
+            return make_grid(self.draw_style, self.GRID_SIZE_X, self.GRID_SIZE_Y)
+        return Grid(self.draw_style, self.GRID_SIZE_X, self.GRID_SIZE_Y)
+
     def reset(self) -> None:
         """Reset the screen."""
-        self.grid = Grid(self.draw_style, self.GRID_SIZE_X, self.GRID_SIZE_Y)
+        self.grid = self.make_grid()
         self.timestamp = 0
 
         self.selected_layer_index = -1
         self.dragging = None
         self.prev_drawn = None
         self.prev_pos = None
+        self.stroke = []   # Pointer positions, in squares, not yet painted this frame
         self.draw_size = 2
 
         # Visual calculations
@@ -60,6 +99,8 @@ class MyWindow(arcade.Window):
         self.GRID_SQ_WIDTH = self.DRAW_PANEL / self.GRID_SIZE_X
         self.GRID_SQ_HEIGHT = self.SCREEN_HEIGHT / self.GRID_SIZE_Y
         self.LAYER_BUTTON_SIZE = self.SIDEBAR_WIDTH / 2
+        if self.TEXTURE_GRID:
+            self.setup_grid_texture()
         # Action button sprites
         self.action_buttons = arcade.SpriteList()
         self.draw_mode_button = arcade.Sprite(
@@ -106,6 +147,38 @@ class MyWindow(arcade.Window):
         """Set up the game and initialize the variables."""
         self.reset()
 
+    def setup_grid_texture(self) -> None:
+        """Create the texture, quad and shader used to draw the grid in a single call."""
+        self.grid_framebuffer = GridFramebuffer(self.GRID_SIZE_X, self.GRID_SIZE_Y)
+        self.grid_texture = self.ctx.texture(
+            (self.GRID_SIZE_X, self.GRID_SIZE_Y),
+            components=3,
+            filter=(self.ctx.NEAREST, self.ctx.NEAREST),
+        )
+        # The quad covers the draw panel, in normalized device coordinates.
+        panel_width = 2 * self.DRAW_PANEL / self.SCREEN_WIDTH
+        self.grid_quad = arcade.gl.geometry.quad_2d(
+            size=(panel_width, 2.0),
+            pos=(panel_width / 2 - 1, 0.0),
+        )
+        self.grid_program = self.ctx.program(
+            vertex_shader=self.GRID_VERTEX_SHADER,
+            fragment_shader=self.GRID_FRAGMENT_SHADER,
+        )
+        self.grid_program["grid_texture"] = 0
+
+    def draw_grid_texture(self, frame) -> None:
+        """Upload the squares which changed since the last frame, then draw the grid quad."""
+        region = self.grid_framebuffer.update(frame)
+        if region is not None:
+            self.grid_texture.write(self.grid_framebuffer.region_bytes(region), viewport=region)
+        self.grid_texture.use(0)
+        self.ctx.scissor = self.grid_framebuffer.screen_rect(
+            (0, 0, self.GRID_SIZE_X, self.GRID_SIZE_Y), self.GRID_SQ_WIDTH, self.GRID_SQ_HEIGHT,
+        )
+        self.grid_quad.render(self.grid_program)
+        self.ctx.scissor = None
+
     def on_draw(self) -> None:
         """Draw everything"""
         self.clear()
@@ -127,6 +200,11 @@ class MyWindow(arcade.Window):
         # UI - Draw Modes / Action buttons
         self.action_buttons.draw()
         # Grid
+        frame = self.grid.render(self.timestamp, self.BG)
+        if self.TEXTURE_GRID:
+            self.draw_grid_texture(frame)
+            return
+        frame = frame.tolist()
         for x in range(self.GRID_SIZE_X):
             for y in range(self.GRID_SIZE_Y):
                 arcade.draw_lrtb_rectangle_filled(
@@ -134,7 +212,7 @@ class MyWindow(arcade.Window):
                     self.GRID_SQ_WIDTH * (x+1),
                     self.GRID_SQ_HEIGHT * (y+1),
                     self.GRID_SQ_HEIGHT * y,
-                    self.grid[x][y].get_color(self.BG[:], self.timestamp, x, y),
+                    frame[x][y],
                 )
 
     def on_mouse_press(self, x: int, y: int, button: int, modifiers: int) -> None:
@@ -185,10 +263,13 @@ class MyWindow(arcade.Window):
                 self.on_special()
         else:
             self.dragging = True
+            self.on_stroke_start()
             self.try_draw(x, y)
 
     def on_mouse_release(self, x: int, y: int, button: int, modifiers: int):
         """Called when the mouse buttons are released."""
+        self.flush_stroke()
+        self.on_stroke_end()
         self.dragging = False
         self.prev_drawn = None
         self.prev_pos = None
@@ -215,6 +296,8 @@ class MyWindow(arcade.Window):
         if self.y_pressed:
             self.on_redo()
             self.y_timer = 0.5
+        if keys.B == symbol:
+            self.grid.next_brush_shape()
 
     def on_key_release(self, symbol: int, modifiers: int) -> None:
         """Called when a keyboard key is released."""
@@ -222,45 +305,55 @@ class MyWindow(arcade.Window):
         self.y_pressed = False
 
     def try_draw(self, x, y) -> None:
-        """Attempt to draw at a position, but safely fail if an invalid square."""
+        """
+        Attempt to draw at a position, but safely fail if an invalid square.
+        Positions are collected, and painted together once per frame by flush_stroke.
+        """
+        if self.selected_layer_index == -1:
+            return
+        self.stroke.append((x / self.GRID_SQ_WIDTH, y / self.GRID_SQ_HEIGHT))
+
+    def flush_stroke(self) -> None:
+        """
+        Paint the stroke since the last frame: the path through the collected
+        positions is swept square by square, and the brushes centred on every
+        square it passes through are painted as one union.
+        """
+        if len(self.stroke) == 0:
+            return
+        points, self.stroke = self.stroke, []
         if self.selected_layer_index == -1:
             return
         layer = get_layers()[self.selected_layer_index]
         if self.prev_pos is not None:
-            # Try draw in increments of 0.5 to avoid skipping squares.
-            mhat_dist = abs(x - self.prev_pos[0]) + abs(y - self.prev_pos[1])
-            increment = 0.5
-            points_to_draw = []
-            for d in range(1, math.ceil(mhat_dist/increment)+1):
-                distance = min(d * increment / mhat_dist, 1)
-                nx = distance * (x - self.prev_pos[0]) + self.prev_pos[0]
-                ny = distance * (y - self.prev_pos[1]) + self.prev_pos[1]
-                nx_pos = int(nx // self.GRID_SQ_WIDTH)
-                ny_pos = int(ny // self.GRID_SQ_HEIGHT)
-                points_to_draw.append((nx_pos, ny_pos))
-        else:
-            x_pos = int(x // self.GRID_SQ_WIDTH)
-            y_pos = int(y // self.GRID_SQ_HEIGHT)
-            points_to_draw = [
-                (x_pos, y_pos)
-            ]
-        for px, py in points_to_draw:
-            if self.prev_drawn is None or (px, py) != self.prev_drawn:
-                if 0 <= px < self.GRID_SIZE_X and 0 <= py < self.GRID_SIZE_Y:
-                    self.on_paint(layer, px, py)
-                    self.prev_drawn = (px, py)
-        self.prev_pos = (x, y)
+            points.insert(0, self.prev_pos)
+        segments = [sweep_cells(*points[0], *points[0])]
+        segments += [sweep_cells(*start, *end) for start, end in zip(points, points[1:])]
+        xs = np.concatenate([seg[0] for seg in segments])
+        ys = np.concatenate([seg[1] for seg in segments])
+        inside = (xs >= 0) & (xs < self.grid.x) & (ys >= 0) & (ys < self.grid.y)
+        xs, ys = xs[inside], ys[inside]
+        # The square painted at the end of the last frame is not painted again
+        start = 0
+        while start < len(xs) and (xs[start], ys[start]) == self.prev_drawn:
+            start += 1
+        xs, ys = xs[start:], ys[start:]
+        if len(xs) > 0:
+            self.on_paint(layer, xs, ys)
+            self.prev_drawn = (int(xs[-1]), int(ys[-1]))
+        self.prev_pos = points[-1]
 
     def start_replay(self) -> None:
         """Begin the replay mode."""
         self.enable_ui = False
-        self.grid = Grid(self.draw_style, self.GRID_SIZE_X, self.GRID_SIZE_Y)
+        self.grid = self.make_grid()
         self.replay_timer = self.REPLAY_TIMER_DELTA
         self.on_replay_start()
 
     def on_update(self, delta_time) -> None:
         """Movement and game logic."""
         self.timestamp += delta_time
+        self.flush_stroke()
         if self.z_pressed:
             self.z_timer -= delta_time
             if self.z_timer <= 0:
@@ -297,43 +390,87 @@ class MyWindow(arcade.Window):
         Best Complexity: O(1)
         Worst Complexity: O(1)
         """
-        self.undo_tracker = UndoTracker()
-        self.replay_tracker = ReplayTracker()
+        self.undo_tracker = UndoTracker(MyWindow.UNDO_BUDGET, MyWindow.UNDO_SPILL)
+        self.replay_tracker = ReplayTracker(MyWindow.UNDO_BUDGET if MyWindow.UNDO_SPILL else None)
+        self.stroke_action = None   # The action collecting the paints of the current stroke
 
     def on_reset(self):
         """Called when a window reset is requested."""
         """
-        Best Complexity: O(1)
-        Worst Complexity: O(1)
+        Best Complexity: O(x*y)
+        Worst Complexity: O(x*y)
         """
-        self.grid.initialize(MyWindow.GRID_SIZE_X, MyWindow.GRID_SIZE_Y)
+        self.grid.initialize(self.grid.x, self.grid.y)
 
     def on_paint(self, layer: Layer, px, py):
         """
         Called when a grid square is clicked on, which should trigger painting in the vicinity.
-        Vicinity squares outside the range [0, GRID_SIZE_X) or [0, GRID_SIZE_Y) can be safely ignored.
+        Vicinity squares outside the grid are ignored.
 
         layer: The layer being applied.
-        px: x position of the brush.
-        py: y position of the brush.
+        px: x position of the brush, or an array of positions along a stroke.
+        py: y position of the brush, or an array of positions along a stroke.
         """
         """
         Best Complexity: O(1)
         Worst Complexity: O(n^2)
         """
-        distance = self.grid.brush_size
-        # Create a painting operation
-        paint_action = PaintAction(is_special = False)
-        # #Traverse the grid range that needs to be painted
-        for x in range(max(0, px - distance), min(px + distance + 1, self.GRID_SIZE_X)):
-            # Calculate the y range to be painted under the current x coordinate
-            y_paint = distance - abs(px - x)
-            # Traverse the y coordinate that needs to be painted
-            for y in range(max(0, py - y_paint), min(py + y_paint + 1, self.GRID_SIZE_Y)):
-                # Add the layer to the grid
-                if self.grid[x][y].add(layer):
-                        paint_action.steps.append(PaintStep((x, y), layer))
-        # Add painting operations to the Undo Tracker and Replay Tracker
+        # Paints during a stroke join its action, otherwise they are an action of their own
+        paint_action = self.stroke_action
+        if paint_action is None:
+            paint_action = PaintAction(is_special = False)
+        # Paint the whole brush footprint at once, and record the brush with the squares which changed
+        _, _, changed = self.grid.paint_footprint(layer, px, py)
+        paint_action.add_paint(BrushPaint.record(
+            px, py, self.grid.brush_size, self.grid.brush_shape, layer, self.grid.x, self.grid.y, changed
+        ))
+        # Add painting operations which changed something to the Undo Tracker and Replay Tracker
+        if self.stroke_action is None and not paint_action.is_empty():
+            self.undo_tracker.add_action(paint_action)
+            self.replay_tracker.add_action(paint_action, False)
+
+    def on_stroke_start(self):
+        """
+        Called when the mouse is pressed on the grid. Every paint until
+        on_stroke_end becomes one action, undone and replayed at once.
+        """
+        """
+        Best Complexity: O(1)
+        Worst Complexity: O(1)
+        """
+        self.on_stroke_end()
+        self.stroke_action = PaintAction(is_special = False)
+
+    def on_stroke_end(self):
+        """Called when the mouse is released, ending the current stroke, if any."""
+        """
+        Best Complexity: O(1)
+        Worst Complexity: O(1)
+        """
+        if self.stroke_action is not None:
+            paint_action, self.stroke_action = self.stroke_action, None
+            self.record_action(paint_action)
+
+    def split_stroke(self):
+        """
+        End the current stroke's action, if any, and continue the stroke as a new one,
+        so actions taken mid-stroke apply after the paints so far.
+        """
+        """
+        Best Complexity: O(1)
+        Worst Complexity: O(1)
+        """
+        if self.stroke_action is not None:
+            self.on_stroke_start()
+
+    def record_action(self, paint_action: PaintAction):
+        """
+        Add an action to the Undo Tracker and Replay Tracker, unless it does nothing.
+        Best Complexity: O(1)
+        Worst Complexity: O(1)
+        """
+        if paint_action.is_empty():
+            return
         self.undo_tracker.add_action(paint_action)
         self.replay_tracker.add_action(paint_action, False)
 
@@ -343,8 +480,10 @@ class MyWindow(arcade.Window):
         Best Complexity: O(1)
         Worst Complexity: O(1)
         """
+        self.split_stroke()
         paint_action = self.undo_tracker.undo(self.grid)
-        self.replay_tracker.add_action(paint_action, True)
+        if paint_action is not None:
+            self.replay_tracker.add_action(paint_action, True)
 
     def on_redo(self):
         """Called when a redo is requested."""
@@ -352,6 +491,7 @@ class MyWindow(arcade.Window):
         Best Complexity: O(1)
         Worst Complexity: O(1)
         """
+        self.split_stroke()
         self.undo_tracker.redo(self.grid)
 
     def on_special(self):
@@ -360,6 +500,7 @@ class MyWindow(arcade.Window):
         Best Complexity: O(1)
         Worst Complexity: O(1)
         """
+        self.split_stroke()
         self.grid.special()
         # Add a special action to the Undo Tracker and Replay Tracker
         self.undo_tracker.add_action(PaintAction(None, True))
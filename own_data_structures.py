@@ -1,6 +1,6 @@
 # @File: own_data_structures.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-27
+# @Last Edit Date: 2026-10-16
 
 from data_structures.queue_adt import *
 from data_structures.abstract_list import *
@@ -8,15 +8,23 @@ from data_structures.referential_array import ArrayR, T
 
 
 class ArrayQueue(Queue[T]):
+    """
+    A circular queue which grows and shrinks as needed.
+
+    The backing array doubles when full and halves when a quarter full,
+    keeping the ring order, and no array is allocated until the first append.
+    An optional max_length caps the number of items, after which the queue is full.
+    """
     MIN_CAPACITY = 1
+    __slots__ = ("capacity", "items", "max_length", "front", "rear")
 
-    def __init__(self,max_capacity:int) -> None:
+    def __init__(self, max_capacity: int = 0, max_length: int | None = None) -> None:
         super().__init__()
-        # Set the capacity of the queue to a maximum of the minimum capacity 
-        # and the specified maximum capacity
-        self.capacity = max(self.MIN_CAPACITY, max_capacity)
+        # max_capacity is the initial capacity, storage is only allocated when needed
+        self.capacity = max(0, max_capacity)
         # Create an array to store the elements in the queue
-        self.items = ArrayR(max(self.MIN_CAPACITY,max_capacity))
+        self.items = ArrayR(self.capacity) if self.capacity > 0 else None
+        self.max_length = max_length
         # Initialize both the front and rear indexes of the queue to 0
         self.front = 0
         self.rear = 0
@@ -24,23 +32,41 @@ class ArrayQueue(Queue[T]):
     def append(self, item: T) -> None:
         """ 
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(n)
+        Worst-Case Complexity = O(n), when resizing, amortised O(1)
         """
         if self.is_full():
-            # If the queue is full, raise an exception
+            # If the queue is at its maximum length, raise an exception
             raise Exception("Queue is full")
+        if self.length == self.capacity:
+            self.resize(max(self.MIN_CAPACITY, 2 * self.capacity))
         # Add the item to the queue and increment the rear index
         self.items[self.rear] = item
         self.rear = (self.rear + 1) % self.capacity
         self.length += 1
 
+    def resize(self, capacity: int) -> None:
+        """
+        Move the items, in order, to a new array of the given capacity (0 to free it).
+        :pre: capacity >= len(self)
+        """
+        """
+        Best-Case Complexity = O(n)
+        Worst-Case Complexity = O(n)
+        """
+        items = ArrayR(capacity) if capacity > 0 else None
+        for i in range(self.length):
+            items[i] = self.items[(self.front + i) % self.capacity]
+        self.items = items
+        self.capacity = capacity
+        self.front = 0
+        self.rear = self.length % capacity if capacity > 0 else 0
 
     def is_full(self) -> bool:
         """
         Best-Case Complexity = O(1)
         Worst-Case Complexity = O(1)
         """
-        return self.length == self.capacity
+        return self.max_length is not None and self.length >= self.max_length
 
     def __getitem__(self, index: int) -> T:
         """
@@ -70,34 +96,87 @@ class ArrayQueue(Queue[T]):
         Best-Case Complexity = O(1)
         Worst-Case Complexity = O(n)
         """
-        i = self.front
-        j = (self.rear - 1) % self.capacity
+        # Swap by position in the queue, so the ring may wrap around the array
+        i = 0
+        j = self.length - 1
         while i < j:
             # Exchange elements in the queue from both ends until i>=j
-            self.items[i], self.items[j] = self.items[j], self.items[i]
-            i = (i + 1) % self.capacity
-            j = (j - 1) % self.capacity
-    
+            self[i], self[j] = self[j], self[i]
+            i += 1
+            j -= 1
 
-    def serve(self) -> None:
-        """ Deletes the element at the queue's front.
+    def serve(self) -> T:
+        """ Deletes and returns the element at the queue's front.
         :pre: queue is not empty
         :raises Exception: if the queue is empty
         """
         """
         Best-Case Complexity = O(1)
-        Worst-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), when shrinking, amortised O(1)
         """
         if self.is_empty():
             # If the queue is empty, raise an exception
             raise Exception("Queue is empty")
         # Delete the element at the front of the queue and increment the front index
+        item = self.items[self.front]
+        self.items[self.front] = None
         self.front = (self.front + 1) % self.capacity
         self.length -= 1
-        
+        if self.length <= self.capacity // 4:
+            self.resize(self.capacity // 2 if self.length > 0 else 0)
+        return item
+
+    def clear(self) -> None:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        super().clear()
+        self.resize(0)
+
 
+class ArrayDeque(ArrayQueue[T]):
+    """
+    An ArrayQueue which is also a stack: items are pushed, popped and peeked
+    at the rear, while the oldest can still be served from the front.
+    """
+    __slots__ = ()
 
+    def push(self, item: T) -> None:
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), when resizing, amortised O(1)
+        """
+        self.append(item)
 
+    def pop(self) -> T:
+        """ Deletes and returns the element at the rear, the last one added.
+        :pre: deque is not empty
+        :raises Exception: if the deque is empty
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(n), when shrinking, amortised O(1)
+        """
+        if self.is_empty():
+            raise Exception("Deque is empty")
+        self.rear = (self.rear - 1) % self.capacity
+        item = self.items[self.rear]
+        self.items[self.rear] = None
+        self.length -= 1
+        if self.length <= self.capacity // 4:
+            self.resize(self.capacity // 2 if self.length > 0 else 0)
+        return item
 
-        
-                    
\ No newline at end of file
+    def peek(self) -> T:
+        """ Returns the element at the rear, without removing it.
+        :pre: deque is not empty
+        :raises Exception: if the deque is empty
+        """
+        """
+        Best-Case Complexity = O(1)
+        Worst-Case Complexity = O(1)
+        """
+        if self.is_empty():
+            raise Exception("Deque is empty")
+        return self[self.length - 1]
@@ -1,17 +1,37 @@
 # @File: replay.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-31
+# @Last Edit Date: 2026-10-16
 
 from __future__ import annotations
 from action import PaintAction
 from grid import Grid
-from data_structures.queue_adt import CircularQueue
+from own_data_structures import ArrayQueue
+from undo import SpillFile, UndoTracker, dump_history, load_history
 
 class ReplayTracker:
+    """
+    The actions to play back, oldest first.
 
-    def __init__(self):
-        self.replay_tracker = CircularQueue(10000)   # Used to store replay operations
+    With a budget, once the actions held in memory are over it, the oldest are
+    compressed and spilled to a temporary file until under LOW_WATER of the
+    budget, and read back in order, one segment at a time, when played.
+    Spilled actions come before those in memory, so once an action cannot be
+    saved, as it uses layers which are not registered, nothing more is spilled.
+    """
+
+    LOW_WATER = UndoTracker.LOW_WATER   # Fraction of the budget left after spilling
+
+    def __init__(self, budget: int | None = None):
+        """
+        budget: Most bytes of actions to keep in memory, or None for no limit.
+        """
+        self.replay_tracker = ArrayQueue()   # Used to store replay operations, bounded only by the budget
         self.replay = False   # Used to determine if replay is active
+        self.budget = budget
+        self.nbytes = 0   # Bytes of the actions held in memory
+        self.spill_file = SpillFile()   # Spilled replay operations, oldest segment first
+        self.paged = ArrayQueue()   # Replay operations read back from the spill file, played first
+        self.pinned = False   # Whether an action could not be spilled, keeping the rest in memory
 
     def start_replay(self) -> None:
         """
@@ -34,10 +54,35 @@ class ReplayTracker:
         """
         """
         Best Complexity: O(1)
-        Worst Complexity: O(1)
+        Worst Complexity: O(n), n being the total size of the actions spilled
         """
         # Add the action to the replay tracker
         self.replay_tracker.append((action, is_undo))
+        self.nbytes += action.nbytes
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        If over budget, spill the oldest actions in memory as one segment,
+        until under LOW_WATER of the budget.
+        Best Complexity: O(1), when within budget
+        Worst Complexity: O(n), n being the total size of the actions spilled
+        """
+        if self.budget is None or self.pinned or self.nbytes <= self.budget:
+            return
+        target = int(self.budget * self.LOW_WATER)
+        count, size = 0, 0
+        while self.nbytes - size > target and count < len(self.replay_tracker):
+            size += self.replay_tracker[count][0].nbytes
+            count += 1
+        data, saved = dump_history([self.replay_tracker[i] for i in range(count)])
+        if saved < count:
+            self.pinned = True
+        if saved == 0:
+            return
+        self.spill_file.push(data)
+        for _ in range(saved):
+            self.nbytes -= self.replay_tracker.serve()[0].nbytes
 
     def play_next_action(self, grid: Grid) -> bool:
         """
@@ -48,13 +93,22 @@ class ReplayTracker:
         """
         """
         Best Complexity: O(1)
-        Worst Complexity: O(1)
+        Worst Complexity: O(n), when reading a spilled segment back
         """
+        # Spilled actions are older than those in the replay tracker
+        if self.paged.is_empty() and len(self.spill_file) > 0:
+            for item in load_history(self.spill_file.serve()):
+                self.paged.append(item)
+                self.nbytes += item[0].nbytes
+        if not self.paged.is_empty():
+            action = self.paged.serve()
         # If the replay tracker is empty, return True
-        if self.replay_tracker.is_empty():
+        elif self.replay_tracker.is_empty():
             return True
-        # Pop the last action from the replay tracker
-        action = self.replay_tracker.serve()
+        else:
+            # Pop the last action from the replay tracker
+            action = self.replay_tracker.serve()
+        self.nbytes -= action[0].nbytes
         # If the action is an undo, undo_apply the action to the grid
         if action[1]:
             action[0].undo_apply(grid)
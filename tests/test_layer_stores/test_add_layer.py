@@ -2,7 +2,7 @@ import unittest
 from ed_utils.decorators import number
 
 from layer_store import AdditiveLayerStore
-from layers import black, lighten, rainbow, invert
+from layers import black, darken, lighten, rainbow, red, invert
 
 class TestAddLayer(unittest.TestCase):
 
@@ -62,3 +62,56 @@ class TestAddLayer(unittest.TestCase):
         s.erase(black)
         s.add(invert)
         self.assertEqual(s.get_color((100, 100, 100), 7, 0, 0), (255-91, 255-214, 255-104))
+
+    @number("2.6")
+    def test_deep_stacks(self):
+        s = AdditiveLayerStore()
+        self.assertEqual(s.runs.capacity, 0)
+        for i in range(50):
+            s.add(invert if i % 7 == 0 else lighten)
+        # Serve some, so the ring wraps around the array before reversing.
+        for _ in range(3):
+            s.erase(black)
+        for i in range(5):
+            s.add(black if i == 0 else lighten)
+        expected = [invert if i % 7 == 0 else lighten for i in range(3, 50)] + [black] + [lighten] * 4
+        self.assertEqual(list(s.layers), expected)
+        s.special()
+        self.assertEqual(list(s.layers), expected[::-1])
+        while s.erase(black):
+            pass
+        self.assertEqual(s.runs.capacity, 0)
+
+    @number("2.7")
+    def test_depth_cap(self):
+        AdditiveLayerStore.MAX_DEPTH = 3
+        try:
+            s = AdditiveLayerStore()
+            self.assertTrue(s.add(lighten))
+            self.assertTrue(s.add(lighten))
+            self.assertTrue(s.add(invert))
+            self.assertFalse(s.add(black))
+            self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), (75, 75, 75))
+        finally:
+            AdditiveLayerStore.MAX_DEPTH = None
+
+    @number("2.8")
+    def test_runs(self):
+        s = AdditiveLayerStore()
+        layers = [lighten] * 3 + [invert] * 1001 + [red] * 500 + [darken] * 2 + [lighten] * 1000 + [invert] * 2
+        for layer in layers:
+            s.add(layer)
+        self.assertEqual(len(s.runs), 6)
+        self.assertEqual(s.layers, layers)
+        # Everything after red is one lookup table.
+        self.assertEqual(len(s.get_fused().static.steps), 2)
+        color = (100, 100, 100)
+        for layer in layers:
+            color = layer.apply(color, 0, 0, 0)
+        self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), color)
+        for _ in range(4):
+            s.erase(black)
+        self.assertEqual(len(s.runs), 5)
+        s.special()
+        self.assertEqual(s.layers, layers[4:][::-1])
+        self.assertEqual(s.get_color((10, 20, 30), 0, 0, 0), (255, 0, 0))
@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+from layer_util import Layer, get_layers
+
+class TestBatchLayers(unittest.TestCase):
+
+    def reference(self, layer: Layer, colors, timestamp, xs, ys):
+        return np.array([
+            [layer.apply(tuple(int(c) for c in colors[i, j]), timestamp, int(xs[i, j]), int(ys[i, j])) for j in range(colors.shape[1])]
+            for i in range(colors.shape[0])
+        ])
+
+    @number("7.1")
+    def test_matches_scalar(self):
+        xs, ys = np.meshgrid(np.arange(20), np.arange(15), indexing="ij")
+        rng = np.random.default_rng(0)
+        for timestamp in [0, 7, 2.35, 101.9]:
+            colors = rng.integers(0, 256, (20, 15, 3))
+            for layer in get_layers():
+                if layer is None: break
+                self.assertTrue(
+                    np.array_equal(
+                        layer.apply_batch(colors, timestamp, xs, ys),
+                        self.reference(layer, colors, timestamp, xs, ys),
+                    ),
+                    f"Batch kernel for {layer.name} differs from apply.",
+                )
+
+    @number("7.2")
+    def test_fallback(self):
+        def swap(color, timestamp, x, y):
+            return (color[2], color[1], x + y)
+        layer = Layer(-1, swap)
+        xs, ys = np.meshgrid(np.arange(4), np.arange(3), indexing="ij")
+        colors = np.full((4, 3, 3), 9)
+        out = layer.apply_batch(colors, 0, xs, ys)
+        self.assertEqual(out.shape, (4, 3, 3))
+        self.assertTrue(np.array_equal(out, self.reference(layer, colors, 0, xs, ys)))
@@ -0,0 +1,97 @@
+import random
+import unittest
+from ed_utils.decorators import number
+
+from layer_compiler import LUT_CACHE_SIZE, PartialChain, compile_chain, intern_lut, lut_array, mask_pipeline
+from layer_store import AdditiveLayerStore, SequenceLayerStore
+from layer_util import Layer, get_layers, reads
+from layers import darken, invert, lighten, rainbow, sparkle
+
+class TestCompiler(unittest.TestCase):
+
+    @number("7.6")
+    def test_fused_matches_layers(self):
+        rng = random.Random(1)
+        layers = [layer for layer in get_layers() if layer is not None]
+        for _ in range(200):
+            chain = [rng.choice(layers) for _ in range(rng.randrange(8))]
+            fused = compile_chain(chain)
+            for color, timestamp, x, y in [((255, 255, 255), 0, 0, 0), ((13, 200, 77), 4.2, 3, 9)]:
+                expected = color
+                for layer in chain:
+                    expected = layer.apply(expected, timestamp, x, y)
+                self.assertEqual(tuple(fused(color, timestamp, x, y)), tuple(expected))
+
+    @number("7.7")
+    def test_collapses(self):
+        self.assertEqual(len(compile_chain([lighten] * 40).steps), 1)
+        self.assertEqual(compile_chain([invert, invert]).steps, [])
+        self.assertEqual(compile_chain([lighten, invert, invert, darken, rainbow]).steps, [rainbow])
+        steps = compile_chain([lighten, lighten, sparkle, invert, darken]).steps
+        self.assertEqual(len(steps), 3)
+        self.assertIs(steps[1], sparkle)
+
+        # Long runs of every length leave the lookup table caches bounded.
+        for count in range(1, 3 * LUT_CACHE_SIZE, 7):
+            chain = compile_chain([(lighten, count), (invert, 1)])
+            self.assertEqual(chain((10, 100, 200), 0, 0, 0), tuple(255 - min(255, v + 40 * count) for v in (10, 100, 200)))
+        self.assertLessEqual(intern_lut.cache_info().currsize, LUT_CACHE_SIZE)
+        self.assertLessEqual(lut_array.cache_info().currsize, LUT_CACHE_SIZE)
+
+    @number("7.8")
+    def test_store_cache(self):
+        s = AdditiveLayerStore()
+        s.add(lighten)
+        s.add(lighten)
+        fused = s.get_fused()
+        self.assertIs(s.get_fused(), fused)
+        self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), (180, 180, 180))
+        s.add(invert)
+        self.assertIsNot(s.get_fused(), fused)
+        self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), (75, 75, 75))
+        s.erase(invert)
+        self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), (115, 115, 115))
+        s.special()
+        self.assertEqual(s.get_color((100, 100, 100), 0, 0, 0), (195, 195, 195))
+
+    @number("7.9")
+    def test_static_prefix(self):
+        calls = []
+        def swap(color, timestamp, x, y):
+            calls.append(timestamp)
+            return (color[2], color[1], color[0])
+        swap_layer = reads("color")(Layer(-1, swap))
+        chain = PartialChain([lighten, swap_layer, sparkle, invert])
+        self.assertEqual(len(chain.dynamic.steps), 2)
+        for timestamp in range(5):
+            expected = (100, 50, 0)
+            for layer in [lighten, swap_layer, sparkle, invert]:
+                expected = layer.apply(expected, timestamp, 2, 3)
+            self.assertEqual(chain((100, 50, 0), timestamp, 2, 3), expected)
+        # 5 reference calls, but the prefix was only evaluated once.
+        self.assertEqual(len(calls), 6)
+
+        for s in [AdditiveLayerStore(), SequenceLayerStore()]:
+            s.add(lighten)
+            s.add(sparkle)
+            first = s.get_color((100, 100, 100), 1, 0, 0)
+            self.assertIn(first, [(180, 180, 180), (100, 100, 100)])
+            s.erase(lighten)
+            self.assertIn(s.get_color((100, 100, 100), 1, 0, 0), [(140, 140, 140), (60, 60, 60)])
+
+    @number("7.13")
+    def test_mask_pipelines(self):
+        registered = [layer for layer in get_layers() if layer is not None]
+        for mask in range(1 << len(registered)):
+            store = SequenceLayerStore()
+            store.layers.elems = mask
+            pipeline = mask_pipeline(mask)
+            self.assertIs(mask_pipeline(mask), pipeline, "Pipelines should be cached per mask.")
+            self.assertEqual(pipeline.positional, any(layer.positional for layer in store.get_chain()))
+            self.assertEqual(pipeline.animated, store.is_animated())
+            for x, y in ((0, 0), (3, 7)):
+                color = (90, 100, 110)
+                for layer in registered:
+                    if mask & (1 << layer.index):
+                        color = layer.apply(color, 2.5, x, y)
+                self.assertEqual(pipeline((90, 100, 110), 2.5, x, y), color)
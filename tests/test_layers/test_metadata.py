@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+from layer_util import Layer, fold_chain, reads
+from layer_store import AdditiveLayerStore, SequenceLayerStore
+from layers import black, darken, invert, lighten, rainbow, red, sparkle
+
+class TestLayerMetadata(unittest.TestCase):
+
+    @number("7.3")
+    def test_declared_reads(self):
+        self.assertTrue(black.constant and red.constant)
+        self.assertFalse(lighten.animated or lighten.positional)
+        self.assertTrue(rainbow.animated and rainbow.positional)
+        self.assertNotIn("color", rainbow.reads)
+        self.assertTrue(sparkle.animated)
+        with self.assertRaises(ValueError):
+            reads("colour")
+
+    @number("7.4")
+    def test_fold_chain(self):
+        self.assertEqual(fold_chain([lighten, invert, black, darken]), [black, darken])
+        self.assertEqual(fold_chain([lighten, black, rainbow, invert]), [rainbow, invert])
+        self.assertEqual(fold_chain([lighten, sparkle]), [lighten, sparkle])
+
+        s = AdditiveLayerStore()
+        for layer in [lighten, rainbow, red, lighten]:
+            s.add(layer)
+        self.assertEqual(s.get_chain(), [red, lighten])
+        self.assertFalse(s.is_animated())
+        s.special()
+        self.assertEqual(s.get_chain(), [rainbow, lighten])
+        self.assertTrue(s.is_animated())
+
+        s = SequenceLayerStore()
+        for layer in [lighten, rainbow, invert]:
+            s.add(layer)
+        # Applied in index order: rainbow, lighten, invert.
+        self.assertEqual(s.get_chain(), [rainbow, lighten, invert])
+        s.add(black)
+        self.assertEqual(s.get_chain(), [black, lighten, invert])
+        self.assertEqual(s.get_color((100, 100, 100), 3, 1, 1), (215, 215, 215))
+
+    @number("7.5")
+    def test_equivalence_classes(self):
+        calls = []
+        def diagonal(color, timestamp, x, y):
+            calls.append((x, y))
+            return (x + y, 0, timestamp)
+        layer = reads("timestamp", key=lambda x, y: x + y)(Layer(-1, diagonal))
+        xs, ys = np.meshgrid(np.arange(6), np.arange(4), indexing="ij")
+        out = layer.apply_batch(np.zeros((6, 4, 3)), 7, xs, ys)
+        # One call per diagonal.
+        self.assertEqual(len(calls), 9)
+        self.assertTrue(np.array_equal(out[..., 0], xs + ys))
+        self.assertTrue((out[..., 2] == 7).all())
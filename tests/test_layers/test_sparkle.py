@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+from layers import LCG_JUMP, sparkle, sparkle_bright, sparkle_mask
+
+def naive_bright(timestamp, x, y):
+    # The original, step by step, sparkle generator.
+    ts = int((timestamp + x/3 + y/5) * 3)
+    other = x
+    for _ in range(10 + (ts * 31 % 17)):
+        other = (1103515245 * other + 12345) % (1 << 31)
+    other += y
+    for _ in range(10 + (ts * 31 % 17)):
+        other = (1103515245 * other + 12345) % (1 << 31)
+    other = (other & ((1 << 31)-1)) >> 16
+    return other/(1 << 15) < 0.1
+
+class TestSparkle(unittest.TestCase):
+
+    @number("7.10")
+    def test_jump_table(self):
+        for x in [0, 1, 12345, (1 << 31) - 1]:
+            stepped = x
+            for k, (a, c) in enumerate(LCG_JUMP):
+                self.assertEqual((a * x + c) % (1 << 31), stepped)
+                stepped = (1103515245 * stepped + 12345) % (1 << 31)
+
+    @number("7.11")
+    def test_matches_naive(self):
+        xs, ys = np.meshgrid(np.arange(40), np.arange(30), indexing="ij")
+        for timestamp in [0, 0.3, 0.34, 7.9, 250.25]:
+            mask = sparkle_mask(timestamp, xs, ys)
+            for x in range(40):
+                for y in range(30):
+                    expected = naive_bright(timestamp, x, y)
+                    self.assertEqual(sparkle_bright(timestamp, x, y), expected)
+                    self.assertEqual(bool(mask[x, y]), expected)
+                    self.assertEqual(
+                        sparkle.apply((100, 100, 100), timestamp, x, y),
+                        (140, 140, 140) if expected else (60, 60, 60),
+                    )
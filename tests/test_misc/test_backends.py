@@ -0,0 +1,185 @@
+import random
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+import layers
+from grid import Grid
+from grid_backends import CSRAddGrid, IndexSetGrid, MaskSequenceGrid, SharedStackGrid, make_grid, registered_layers
+
+class TestBackends(unittest.TestCase):
+
+    def paint(self, grids, seed, steps=300):
+        rng = random.Random(seed)
+        all_layers = registered_layers()
+        for _ in range(steps):
+            x, y = rng.randrange(grids[0].x), rng.randrange(grids[0].y)
+            layer = rng.choice(all_layers)
+            action = rng.random()
+            if action < 0.02:
+                for grid in grids:
+                    grid.special()
+            elif action < 0.2:
+                results = [grid.erase(x, y, layer) for grid in grids]
+                self.assertEqual(len(set(map(bool, results))), 1)
+            else:
+                results = [grid.add(x, y, layer) for grid in grids]
+                self.assertEqual(len(set(map(bool, results))), 1)
+
+    def assertRenderedEqual(self, grid1, grid2, timestamp, background):
+        frame1 = grid1.render(timestamp, background)
+        frame2 = grid2.render(timestamp, background)
+        self.assertTrue((frame1 == frame2).all(), "Backends render differently.")
+        for x in range(grid1.x):
+            for y in range(grid1.y):
+                self.assertEqual(
+                    grid1.peek(x, y).get_color(background, timestamp, x, y),
+                    grid2.peek(x, y).get_color(background, timestamp, x, y),
+                )
+
+    @number("8.5")
+    def test_mask_sequence_grid(self):
+        grid = Grid(Grid.DRAW_STYLE_SEQUENCE, 9, 7)
+        masked = MaskSequenceGrid(9, 7)
+        self.paint([grid, masked], seed=5)
+        for timestamp in (0, 1.5, 20):
+            self.assertRenderedEqual(grid, masked, timestamp, (255, 255, 255))
+        self.assertRenderedEqual(grid, masked, 3, (10, 20, 30))
+        for x in range(9):
+            for y in range(7):
+                self.assertEqual(masked.masks[x, y], grid.peek(x, y).layers.elems)
+
+        # Pending specials are applied together, stopping once every square is empty.
+        for g in (grid, masked):
+            for _ in range(50):
+                g.special()
+        self.assertEqual(masked.pending_specials, 50)
+        self.assertRenderedEqual(grid, masked, 4, (255, 255, 255))
+        self.assertEqual(masked.pending_specials, 0)
+        self.assertFalse(masked.masks.any())
+
+        # Painting a whole footprint at once.
+        xs, ys = np.array([0, 1, 2, 3]), np.array([0, 0, 1, 1])
+        masked.add(1, 0, layers.black)
+        self.assertEqual(masked.add_many(xs, ys, layers.black).tolist(), [True, False, True, True])
+        self.assertEqual(masked.erase_many(xs, ys, layers.black).tolist(), [True, True, True, True])
+        # Views write through to the grid.
+        masked[4][4].add(layers.red)
+        self.assertTrue(masked.masks[4, 4] & (1 << layers.red.index))
+
+    @number("8.6")
+    def test_index_set_grid(self):
+        grid = Grid(Grid.DRAW_STYLE_SET, 9, 7)
+        indexed = IndexSetGrid(9, 7)
+        self.paint([grid, indexed], seed=6)
+        for timestamp in (0, 1.5, 20):
+            self.assertRenderedEqual(grid, indexed, timestamp, (255, 255, 255))
+        # Special is a single toggle, and cancels out.
+        layers_before = indexed.layers.copy()
+        for grid_ in (grid, indexed):
+            grid_.special()
+        self.assertTrue((indexed.layers == layers_before).all())
+        self.assertRenderedEqual(grid, indexed, 2, (10, 20, 30))
+        # Inverting a single square through its view.
+        for grid_ in (grid, indexed):
+            grid_[3][3].special()
+            grid_[3][3].add(layers.rainbow)
+        self.assertEqual(indexed[3][3].mode, grid.peek(3, 3).mode)
+        self.assertRenderedEqual(grid, indexed, 2.5, (10, 20, 30))
+        self.assertRenderedEqual(grid, indexed, 3, (10, 20, 30))
+
+    @number("8.9")
+    def test_shared_stack_grid(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 9, 7)
+        shared = SharedStackGrid(9, 7)
+        shared.COMPACT_MIN = 8
+        self.paint([grid, shared], seed=7, steps=600)
+        for timestamp in (0, 1.5, 20):
+            self.assertRenderedEqual(grid, shared, timestamp, (255, 255, 255))
+        for x in range(9):
+            for y in range(7):
+                self.assertEqual(shared.peek(x, y).layers, grid.peek(x, y).layers)
+        # Compaction keeps the table close to the live stacks.
+        self.assertLessEqual(len(shared.table), shared.COMPACT_FACTOR * len(np.unique(shared.stack_ids)) + 1)
+
+        # Squares painted by the same strokes share one stack.
+        shared = SharedStackGrid(10, 10)
+        xs, ys = np.nonzero(np.ones((10, 10), dtype=bool))
+        for layer in (layers.lighten, layers.invert, layers.lighten, layers.lighten):
+            self.assertTrue(shared.add_many(xs, ys, layer).all())
+        self.assertEqual(len(np.unique(shared.stack_ids)), 1)
+        self.assertEqual(shared.stack_at(0, 0).runs, ((layers.lighten.index, 1), (layers.invert.index, 1), (layers.lighten.index, 2)))
+        shared.special()
+        self.assertEqual(shared.stack_at(9, 9).runs, ((layers.lighten.index, 2), (layers.invert.index, 1), (layers.lighten.index, 1)))
+        frame = shared.render(0, (100, 100, 100))
+        self.assertEqual(tuple(frame[3, 4]), (255 - 180 + 40,) * 3)
+        # A pair of specials cancels without interning any stack.
+        stacks = len(shared.table)
+        ids = shared.stack_ids.copy()
+        shared.special()
+        shared.special()
+        self.assertFalse(shared.dirty.any())
+        self.assertEqual(len(shared.table), stacks)
+        self.assertTrue((shared.stack_ids == ids).all())
+        self.assertTrue((shared.render(0, (100, 100, 100)) == frame).all())
+
+    @number("8.8")
+    def test_csr_add_grid(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 9, 7)
+        csr = CSRAddGrid(9, 7)
+        csr.COMPACT_MIN = 16
+        self.paint([grid, csr], seed=8, steps=600)
+        for timestamp in (0, 1.5, 20):
+            self.assertRenderedEqual(grid, csr, timestamp, (255, 255, 255))
+        for x in range(9):
+            for y in range(7):
+                self.assertEqual(csr.peek(x, y).layers, grid.peek(x, y).layers)
+        self.assertLessEqual(csr.garbage, max(csr.COMPACT_MIN, csr.used // 2))
+        csr.compact()
+        self.assertEqual(csr.used, csr.length.sum())
+        self.assertRenderedEqual(grid, csr, 3, (10, 20, 30))
+
+        # Reversing, then adding, moves the square to a fresh slot in order.
+        for g in (grid, csr):
+            g[0][0].special()
+            g.add(0, 0, layers.sparkle)
+            g.erase(0, 0, layers.sparkle)
+        self.assertEqual(csr.peek(0, 0).layers, grid.peek(0, 0).layers)
+        self.assertRenderedEqual(grid, csr, 4, (255, 255, 255))
+
+        # The compiled chain of a square is kept until the square changes.
+        pipeline = csr.get_pipeline(1, 1)
+        self.assertIs(csr.get_pipeline(1, 1), pipeline)
+        for g in (grid, csr):
+            g[1][1].add(layers.invert)
+        self.assertNotIn((1, 1), csr.pipelines)
+        self.assertIsNot(csr.get_pipeline(1, 1), pipeline)
+        for g in (grid, csr):
+            g.add_many(np.array([1, 2]), np.array([1, 1]), layers.invert)
+        self.assertNotIn((1, 1), csr.pipelines)
+        self.assertRenderedEqual(grid, csr, 4, (255, 255, 255))
+
+        # A pair of specials cancels, leaving every square clean.
+        for g in (grid, csr):
+            g.special()
+            g.special()
+        self.assertFalse(csr.dirty.any())
+        self.assertRenderedEqual(grid, csr, 4, (255, 255, 255))
+        for g in (grid, csr):
+            g.special()
+        self.assertRenderedEqual(grid, csr, 5, (255, 255, 255))
+
+    @number("8.10")
+    def test_repeated_squares(self):
+        xs, ys = np.array([1, 2, 1, 1, 3, 2]), np.array([0, 4, 0, 0, 3, 4])
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            backends = [make_grid(draw_style, 5, 5)]
+            if draw_style == Grid.DRAW_STYLE_ADD:
+                backends.append(SharedStackGrid(5, 5))
+            for backend in backends:
+                grid = Grid(draw_style, 5, 5)
+                # Each occurrence is applied in turn, as one square at a time.
+                for layer in (layers.lighten, layers.invert):
+                    self.assertEqual(backend.add_many(xs, ys, layer).tolist(), grid.add_many(xs, ys, layer).tolist())
+                self.assertEqual(backend.erase_many(xs[:3], ys[:3], layers.lighten).tolist(), grid.erase_many(xs[:3], ys[:3], layers.lighten).tolist())
+                self.assertRenderedEqual(grid, backend, 0, (100, 100, 100))
@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+from layers import red
+from grid import Grid
+from grid_backends import make_grid
+from brushes import BRUSH_DIAMOND, BRUSH_DISC, BRUSH_SHAPES, BRUSH_SQUARE, footprint, footprint_mask, stroke_footprint, sweep_cells
+
+class TestBrushes(unittest.TestCase):
+
+    def brute_force(self, px, py, size, shape, width, height):
+        squares = set()
+        for x in range(width):
+            for y in range(height):
+                dx, dy = abs(x - px), abs(y - py)
+                if shape == BRUSH_DIAMOND:
+                    inside = dx + dy <= size
+                elif shape == BRUSH_SQUARE:
+                    inside = max(dx, dy) <= size
+                else:
+                    inside = dx * dx + dy * dy <= size * size
+                if inside:
+                    squares.add((x, y))
+        return squares
+
+    @number("9.1")
+    def test_footprints(self):
+        self.assertEqual(int(footprint_mask(2, BRUSH_DIAMOND).sum()), 13)
+        self.assertEqual(int(footprint_mask(2, BRUSH_SQUARE).sum()), 25)
+        self.assertEqual(int(footprint_mask(2, BRUSH_DISC).sum()), 13)
+        self.assertEqual(int(footprint_mask(0, BRUSH_DISC).sum()), 1)
+        self.assertIs(footprint_mask(3), footprint_mask(3, BRUSH_DIAMOND))
+        self.assertRaises(ValueError, footprint_mask, 2, "star")
+        self.assertRaises(ValueError, footprint_mask, -1)
+
+        # Clipped to the grid, including brushes centred off it.
+        for shape in BRUSH_SHAPES:
+            for size in (0, 1, 3, 7):
+                for px, py in ((0, 0), (5, 4), (9, 6), (-2, 3), (4, 12), (30, 30)):
+                    xs, ys = footprint(px, py, size, shape, 10, 7)
+                    squares = set(zip(xs.tolist(), ys.tolist()))
+                    self.assertEqual(len(squares), len(xs))
+                    self.assertEqual(squares, self.brute_force(px, py, size, shape, 10, 7))
+
+    @number("9.2")
+    def test_large_brushes(self):
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            for grid in (Grid(draw_style, 40, 30), make_grid(draw_style, 40, 30)):
+                grid.brush_size = 100
+                grid.brush_shape = BRUSH_SQUARE
+                xs, ys = grid.paint(red, 20, 15)
+                self.assertEqual(len(xs), 40 * 30)
+                # Painting again only changes additive squares.
+                xs, ys = grid.paint(red, 20, 15)
+                self.assertEqual(len(xs), 40 * 30 if draw_style == Grid.DRAW_STYLE_ADD else 0)
+                frame = grid.render(0, (0, 0, 0))
+                self.assertTrue((frame == np.array([255, 0, 0])).all())
+
+        grid = Grid(Grid.DRAW_STYLE_SET, 5, 5)
+        for _ in range(2 * Grid.MAX_BRUSH):
+            grid.increase_brush_size()
+        self.assertEqual(grid.brush_size, Grid.MAX_BRUSH)
+        for shape in BRUSH_SHAPES[1:] + BRUSH_SHAPES[:1]:
+            grid.next_brush_shape()
+            self.assertEqual(grid.brush_shape, shape)
+
+    @number("9.3")
+    def test_strokes(self):
+        for x0, y0, x1, y1 in ((0.5, 0.5, 0.5, 0.5), (0.2, 0.7, 6.9, 3.1), (5.5, 9.9, -2.3, 0.1), (1.5, 1.5, 1.5, 8.5)):
+            xs, ys = sweep_cells(x0, y0, x1, y1)
+            cells = list(zip(xs.tolist(), ys.tolist()))
+            self.assertEqual(cells[0], (int(np.floor(x0)), int(np.floor(y0))))
+            self.assertEqual(cells[-1], (int(np.floor(x1)), int(np.floor(y1))))
+            # Neighbouring squares, with every square on the path found.
+            for (ax, ay), (bx, by) in zip(cells, cells[1:]):
+                self.assertEqual(abs(ax - bx) + abs(ay - by), 1)
+            ts = np.linspace(0, 1, 2001)
+            sampled = set(zip(np.floor(x0 + ts * (x1 - x0)).astype(int).tolist(), np.floor(y0 + ts * (y1 - y0)).astype(int).tolist()))
+            self.assertEqual(sampled, set(cells))
+
+        # The union of the brushes along the stroke, each square once.
+        pxs, pys = np.array([-3, 0, 1, 2, 2, 9, 12]), np.array([1, 1, 2, 2, 2, 6, 12])
+        for shape in BRUSH_SHAPES:
+            xs, ys = stroke_footprint(pxs, pys, 2, shape, 10, 7)
+            expected = set()
+            for px, py in zip(pxs, pys):
+                expected |= self.brute_force(px, py, 2, shape, 10, 7)
+            self.assertEqual(len(xs), len(expected))
+            self.assertEqual(set(zip(xs.tolist(), ys.tolist())), expected)
+        self.assertEqual(len(stroke_footprint([50], [50], 2, BRUSH_DIAMOND, 10, 7)[0]), 0)
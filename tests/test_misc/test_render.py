@@ -0,0 +1,180 @@
+import unittest
+import numpy as np
+from ed_utils.decorators import number
+
+from layers import rainbow, lighten, sparkle, black
+from grid import Grid
+from framebuffer import GridFramebuffer
+
+class TestRender(unittest.TestCase):
+
+    @number("8.1")
+    def test_render(self):
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            grid = Grid(draw_style, 6, 4)
+            grid[1][1].add(rainbow)
+            grid[1][1].add(lighten)
+            grid[2][3].add(sparkle)
+            grid[5][0].add(black)
+            grid.special()
+            frame = grid.render(3.5, (255, 255, 255))
+            self.assertEqual(frame.shape, (6, 4, 3))
+            self.assertEqual(frame.dtype, np.uint8)
+            self.assertTrue(frame.flags["C_CONTIGUOUS"])
+            self.assertGridRendered(grid, frame, 3.5, (255, 255, 255))
+
+    @number("8.2")
+    def test_framebuffer_regions(self):
+        grid = Grid(Grid.DRAW_STYLE_SET, 8, 5)
+        fb = GridFramebuffer(8, 5)
+        # First frame uploads everything.
+        self.assertEqual(fb.update(grid.render(0, (255, 255, 255))), (0, 0, 8, 5))
+        self.assertEqual(fb.update(grid.render(0, (255, 255, 255))), None)
+        grid[2][1].add(black)
+        grid[4][3].add(black)
+        region = fb.update(grid.render(0, (255, 255, 255)))
+        self.assertEqual(region, (2, 1, 3, 3))
+        # Texture layout is row major, with rows along y.
+        data = np.frombuffer(fb.region_bytes(region), dtype=np.uint8).reshape(3, 3, 3)
+        self.assertEqual(tuple(data[0, 0]), (0, 0, 0))
+        self.assertEqual(tuple(data[2, 2]), (0, 0, 0))
+        self.assertEqual(tuple(data[0, 2]), (255, 255, 255))
+        self.assertEqual(GridFramebuffer.screen_rect(region, 2.5, 10), (5, 10, 8, 30))
+
+    @number("8.3")
+    def test_cached_render(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 5, 5)
+        grid.add(0, 0, black)
+        grid.add(1, 1, rainbow)
+        grid.render(0, (255, 255, 255))
+        self.assertFalse(grid.dirty.any())
+        self.assertEqual(grid.animated.tolist(), [[x == y == 1 for y in range(5)] for x in range(5)])
+
+        calls = []
+        store = grid.peek(0, 0)
+        # Stores have no __dict__, so spy on the class instead
+        store_class = type(store)
+        get_color = store_class.get_color
+        def spy(self, *args):
+            if self is store:
+                calls.append(args)
+            return get_color(self, *args)
+        store_class.get_color = spy
+        self.addCleanup(setattr, store_class, "get_color", get_color)
+        frame = grid.render(2, (255, 255, 255))
+        self.assertEqual(calls, [], "Unchanged, static squares should not be recomputed.")
+        self.assertGridRendered(grid, frame, 2, (255, 255, 255))
+
+        # Changes through the grid, or through a handed out store, are both picked up.
+        calls.clear()
+        grid.add(0, 0, lighten)
+        grid[2][2].add(sparkle)
+        frame = grid.render(4, (255, 255, 255))
+        self.assertEqual(len(calls), 1)
+        self.assertGridRendered(grid, frame, 4, (255, 255, 255))
+        # So are changes to the background.
+        frame = grid.render(4, (0, 0, 0))
+        self.assertGridRendered(grid, frame, 4, (0, 0, 0))
+
+    @number("8.4")
+    def test_lazy_stores(self):
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            grid = Grid(draw_style, 200, 300)
+            self.assertIs(grid.peek(10, 20), grid.blank)
+            self.assertFalse(grid.allocated.any())
+            # Reading through grid[x][y] neither allocates nor dirties.
+            grid.render(0, (255, 255, 255))
+            self.assertEqual(len(list(grid[5])), 300)
+            self.assertEqual(grid[6][7].get_color((255, 255, 255), 0, 6, 7), (255, 255, 255))
+            self.assertFalse(grid[6][7].is_animated())
+            self.assertRaises(IndexError, grid[6].__getitem__, 300)
+            self.assertFalse(grid.allocated.any())
+            self.assertFalse(grid.dirty.any())
+            # Writes which change nothing do not allocate.
+            self.assertFalse(grid.erase(10, 20, black))
+            self.assertFalse(grid.allocated.any())
+            self.assertTrue(grid.add(10, 20, black))
+            self.assertEqual(grid.allocated.sum(), 1)
+            self.assertIsNot(grid.peek(10, 20), grid.blank)
+            self.assertIs(grid.peek(10, 21), grid.blank)
+            grid[3][4].add(rainbow)
+            self.assertEqual(grid.allocated.sum(), 2)
+            # Special also applies to untouched squares.
+            grid.special()
+            frame = grid.render(1, (255, 255, 255))
+            self.assertEqual(grid.allocated.sum(), 2)
+            for x, y in ((10, 20), (3, 4), (0, 0), (199, 299)):
+                self.assertEqual(tuple(frame[x, y]), grid.peek(x, y).get_color((255, 255, 255), 1, x, y))
+        self.assertEqual(tuple(frame[0, 0]), (255, 255, 255))
+        grid = Grid(Grid.DRAW_STYLE_SET, 3, 3)
+        grid.special()
+        self.assertEqual(tuple(grid.render(0, (255, 255, 255))[1, 1]), (0, 0, 0))
+        # Iterating over the columns stops at the edge of the grid.
+        self.assertEqual(len(list(grid)), 3)
+        self.assertRaises(IndexError, grid.__getitem__, 3)
+        self.assertRaises(IndexError, grid.__getitem__, -1)
+
+    @number("8.7")
+    def test_lazy_special(self):
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            grid = Grid(draw_style, 4, 4)
+            control = Grid(draw_style, 4, 4)
+            for g in (grid, control):
+                g.add(1, 1, rainbow)
+                g.add(1, 1, lighten)
+                g.add(1, 1, black)
+                g.add(2, 2, sparkle)
+            for _ in range(7):
+                grid.special()
+            # Specials are only counted, until a store is used.
+            self.assertEqual(grid.epoch, 7)
+            self.assertEqual(grid.grid[1][1][1], 0)   # Specials seen by the store
+            for _ in range(7 if draw_style == Grid.DRAW_STYLE_SEQUENCE else 1):
+                control.special()
+            for x in range(4):
+                for y in range(4):
+                    self.assertEqual(
+                        grid.peek(x, y).get_color((255, 255, 255), 1, x, y),
+                        control.peek(x, y).get_color((255, 255, 255), 1, x, y),
+                    )
+            self.assertEqual(grid.grid[1][1][1], 7)
+            self.assertGridRendered(grid, grid.render(1, (255, 255, 255)), 1, (255, 255, 255))
+            # Stores allocated after a special do not apply it again.
+            grid.add(3, 3, rainbow)
+            control.add(3, 3, rainbow)
+            self.assertEqual(
+                grid.peek(3, 3).get_color((255, 255, 255), 1, 3, 3),
+                control.peek(3, 3).get_color((255, 255, 255), 1, 3, 3),
+            )
+
+            # SET and ADD specials undo themselves, so a pair recomputes nothing.
+            if draw_style == Grid.DRAW_STYLE_SEQUENCE:
+                continue
+            grid.add(0, 0, black)
+            grid.render(2, (255, 255, 255))
+            calls = []
+            store = grid.peek(0, 0)
+            store_class = type(store)
+            get_color = store_class.get_color
+            def spy(self, *args):
+                if self is store:
+                    calls.append(args)
+                return get_color(self, *args)
+            store_class.get_color = spy
+            self.addCleanup(setattr, store_class, "get_color", get_color)
+            grid.special()
+            grid.special()
+            frame = grid.render(2, (255, 255, 255))
+            store_class.get_color = get_color
+            self.assertEqual(calls, [], "Cancelled specials should not recompute squares.")
+            self.assertGridRendered(grid, frame, 2, (255, 255, 255))
+
+    def assertGridRendered(self, grid: Grid, frame, timestamp, background):
+        for x in range(grid.x):
+            for y in range(grid.y):
+                # Read the store directly, so the square is not marked dirty.
+                self.assertEqual(
+                    tuple(frame[x, y]),
+                    grid.peek(x, y).get_color(background, timestamp, x, y),
+                    "Rendered frame does not match get_color.",
+                )
@@ -102,6 +102,47 @@ class TestReplay(unittest.TestCase):
         self.assertGridEqual(grid, control_grid)
         self.assertEqual(replay.play_next_action(grid), True) # Finished.
 
+    @number("5.4")
+    def test_spilled_replay(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        control_grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        actions = [PaintAction([PaintStep((i % 10, y), (blue, green, red, invert)[i % 4]) for y in range(i % 5 + 1)]) for i in range(120)]
+        budget = 1500
+
+        # Older actions are spilled, and played back in order, within budget.
+        replay = ReplayTracker(budget)
+        for i, action in enumerate(actions):
+            replay.add_action(action, is_undo=i % 7 == 6)
+            self.assertLessEqual(replay.nbytes, budget)
+        self.assertGreater(replay.spill_file.nbytes, 0)
+        replay.start_replay()
+        for i, action in enumerate(actions):
+            self.assertFalse(replay.play_next_action(grid))
+            self.assertLessEqual(replay.nbytes, budget)
+            if i % 7 == 6:
+                action.undo_apply(control_grid)
+            else:
+                action.redo_apply(control_grid)
+        self.assertTrue(replay.play_next_action(grid))
+        self.assertEqual(replay.nbytes, 0)
+        self.assertGridEqual(grid, control_grid)
+
+    @number("5.5")
+    def test_long_replay(self):
+        # No cap on the number of actions, with or without a budget.
+        grid = Grid(Grid.DRAW_STYLE_SET, 10, 10)
+        action = PaintAction([PaintStep((1, 1), red)])
+        for budget in (None, 64 * 1024 * 1024):
+            replay = ReplayTracker(budget)
+            for _ in range(12000):
+                replay.add_action(action)
+            self.assertEqual(len(replay.replay_tracker), 12000)
+            replay.start_replay()
+            count = 0
+            while not replay.play_next_action(grid):
+                count += 1
+            self.assertEqual(count, 12000)
+
     def assertGridEqual(self, grid1: Grid, grid2: Grid):
         for x in range(len(grid1.grid)):
             for y in range(len(grid1[x])):
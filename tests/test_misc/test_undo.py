@@ -1,10 +1,15 @@
 import unittest
 from ed_utils.decorators import number
 
-from action import PaintAction, PaintStep
+import sys
+import numpy as np
+import random
+from action import BrushPaint, PaintAction, PaintStep, PaintSteps
 from undo import UndoTracker
-from layers import green, red, blue
+from layers import green, red, blue, lighten, invert
+from layer_util import Layer
 from grid import Grid
+from brushes import BRUSH_DISC
 
 class TestUndo(unittest.TestCase):
 
@@ -65,6 +70,213 @@ class TestUndo(unittest.TestCase):
         action = undo.undo(grid)
         self.assertEqual(action, None)
 
+    @number("4.2")
+    def test_packed_steps(self):
+        rng = random.Random(4)
+        steps = [PaintStep((rng.randrange(6), rng.randrange(6)), rng.choice((lighten, invert, red))) for _ in range(200)]
+        # Runs of one layer over the same squares, as strokes make.
+        steps += [PaintStep((x, y), lighten) for _ in range(3) for x in range(6) for y in range(6)]
+        action = PaintAction(steps[:], False)
+        self.assertIsInstance(action.steps, PaintSteps)
+        self.assertEqual(action.steps, steps)
+        self.assertEqual(action.steps[7], steps[7])
+        self.assertEqual(len(action.steps.palette), 3)
+
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            grid = Grid(draw_style, 6, 6)
+            control_grid = Grid(draw_style, 6, 6)
+            control_grid[0][0].add(blue)
+            grid[0][0].add(blue)
+            action.redo_apply(grid)
+            for step in steps:
+                step.redo_apply(control_grid)
+            self.assertGridEqual(grid, control_grid)
+            action.undo_apply(grid)
+            for step in reversed(steps):
+                step.undo_apply(control_grid)
+            self.assertGridEqual(grid, control_grid)
+
+        # Far smaller than a list of PaintSteps.
+        listed = sys.getsizeof(steps) + sum(sys.getsizeof(step) + sys.getsizeof(step.affected_grid_square) for step in steps)
+        self.assertLess(action.nbytes * 10, listed)
+        self.assertTrue(PaintAction(None, True).steps == [])
+        self.assertTrue(PaintAction().is_empty())
+
+    @number("4.3")
+    def test_brush_paints(self):
+        for draw_style in Grid.DRAW_STYLE_OPTIONS:
+            grid = Grid(draw_style, 30, 20)
+            control_grid = Grid(draw_style, 30, 20)
+            for g in (grid, control_grid):
+                g[10][10].add(green)
+                g[11][10].add(green)
+                g.brush_size = 4
+            action = PaintAction()
+            for px, py, layer in ((10, 10, green), (np.array([28, 29, 29]), np.array([3, 3, 4]), red)):
+                xs, ys, changed = grid.paint_footprint(layer, px, py)
+                action.add_paint(BrushPaint.record(px, py, grid.brush_size, grid.brush_shape, layer, grid.x, grid.y, changed))
+                # Expands to exactly the squares which changed.
+                paint = action.paints[-1]
+                self.assertEqual(paint.squares()[0].tolist(), xs[changed].tolist())
+                self.assertEqual(paint.squares()[1].tolist(), ys[changed].tolist())
+                for x, y in zip(xs[changed].tolist(), ys[changed].tolist()):
+                    control_grid[x][y].add(layer)
+            self.assertGridEqual(grid, control_grid)
+            self.assertEqual(action.changed_count(), len(action.paints[0].squares()[0]) + len(action.paints[1].squares()[0]))
+            action.undo_apply(grid)
+            action.undo_apply(control_grid)
+            self.assertEqual(grid[10][10].get_color((0, 0, 0), 0, 10, 10), green.apply((0, 0, 0), 0, 10, 10))
+            self.assertEqual(grid[12][10].get_color((0, 0, 0), 0, 12, 10), (0, 0, 0))
+            self.assertGridEqual(grid, control_grid)
+            action.redo_apply(grid)
+            self.assertEqual(grid[12][10].get_color((0, 0, 0), 0, 12, 10), green.apply((0, 0, 0), 0, 12, 10))
+
+        # Each encoding expands back to the changed squares.
+        xs, ys = BrushPaint.record(20, 20, 10, BRUSH_DISC, red, 40, 40, np.ones(317, dtype=bool)).squares()
+        self.assertEqual(len(xs), 317)
+        for changed, encoding in (
+            (np.arange(317) % 2 == 0, BrushPaint.ENCODE_BITS),
+            (np.arange(317) == 3, BrushPaint.ENCODE_ONLY),
+            (np.arange(317) != 3, BrushPaint.ENCODE_EXCEPT),
+        ):
+            paint = BrushPaint.record(20, 20, 10, BRUSH_DISC, red, 40, 40, changed)
+            self.assertEqual(paint.encoding, encoding)
+            self.assertEqual(paint.squares()[0].tolist(), xs[changed].tolist())
+            self.assertEqual(paint.squares()[1].tolist(), ys[changed].tolist())
+
+        # The size of a record barely depends on the brush size.
+        sizes = []
+        for size in (2, 20, 60):
+            grid = Grid(Grid.DRAW_STYLE_SET, 128, 128)
+            grid.brush_size, grid.brush_shape = size, BRUSH_DISC
+            grid[64][64].add(red)
+            _, _, changed = grid.paint_footprint(red, 64, 64)
+            sizes.append(BrushPaint.record(64, 64, size, BRUSH_DISC, red, 128, 128, changed).nbytes)
+        self.assertLess(max(sizes) - min(sizes), 16)
+
+    @number("4.4")
+    def test_budget(self):
+        def stroke(i):
+            layer = (red, green, blue)[i % 3]
+            return PaintAction([PaintStep((i % 10, y), layer) for y in range(10)])
+        actions = [stroke(i) for i in range(40)]
+        budget = 5 * actions[0].nbytes
+
+        # Oldest actions are evicted first, and new actions are never refused.
+        undo = UndoTracker(budget)
+        for action in actions:
+            undo.add_action(action)
+            self.assertLessEqual(undo.nbytes, budget)
+        self.assertIs(undo.undo_tracker.peek(), actions[-1])
+        kept = len(undo.undo_tracker)
+        self.assertTrue(0 < kept <= 5)
+        grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        for _ in range(kept):
+            self.assertIsNotNone(undo.undo(grid))
+        self.assertIsNone(undo.undo(grid))
+        # A single action over budget is still kept.
+        undo = UndoTracker(1)
+        undo.add_action(actions[0])
+        self.assertIs(undo.undo(grid), actions[0])
+
+        # Spilled history pages back in, in order, with bounded memory.
+        grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        control_grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        undo = UndoTracker(budget, spill=True)
+        for action in actions:
+            action.redo_apply(grid)
+            undo.add_action(action)
+            self.assertLessEqual(undo.nbytes, budget)
+        self.assertGreater(undo.spilled_bytes, 0)
+        for action in reversed(actions[20:]):
+            undone = undo.undo(grid)
+            self.assertEqual(undone.steps, action.steps)
+        for action in actions:
+            action.redo_apply(control_grid)
+        for action in reversed(actions[20:]):
+            action.undo_apply(control_grid)
+        self.assertGridEqual(grid, control_grid)
+        # Redo, then branch off, then undo everything.
+        self.assertEqual(undo.redo(grid).steps, actions[20].steps)
+        undo.add_action(PaintAction(None, True))
+        grid.special()
+        count = 0
+        while undo.undo(grid) is not None:
+            count += 1
+        self.assertEqual(count, 22)
+        self.assertEqual(undo.undo_spill.nbytes, 0)
+        actions[20].redo_apply(control_grid)
+        for action in reversed(actions[:21]):
+            action.undo_apply(control_grid)
+        self.assertGridEqual(grid, control_grid)
+
+    @number("4.5")
+    def test_spill(self):
+        def stroke(i):
+            layer = (red, green, blue, lighten)[i % 4]
+            return PaintAction([PaintStep((i % 10, y), layer) for y in range((i % 7) + 1)])
+        actions = [stroke(i) for i in range(200)]
+        budget = 2000
+
+        # Memory stays within budget while undoing and redoing everything.
+        grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        control_grid = Grid(Grid.DRAW_STYLE_ADD, 10, 10)
+        undo = UndoTracker(budget, spill=True)
+        for action in actions:
+            action.redo_apply(grid)
+            undo.add_action(action)
+        for action in reversed(actions):
+            self.assertEqual(undo.undo(grid).steps, action.steps)
+            self.assertLessEqual(undo.nbytes, budget)
+        self.assertIsNone(undo.undo(grid))
+        self.assertGridEqual(grid, control_grid)
+        for action in actions[:150]:
+            self.assertEqual(undo.redo(grid).steps, action.steps)
+            self.assertLessEqual(undo.nbytes, budget)
+            action.redo_apply(control_grid)
+        self.assertGridEqual(grid, control_grid)
+        for action in reversed(actions[:150]):
+            self.assertEqual(undo.undo(grid).steps, action.steps)
+            self.assertLessEqual(undo.nbytes, budget)
+        self.assertIsNone(undo.undo(grid))
+
+        # Brush paints round trip through the spill file.
+        grid = Grid(Grid.DRAW_STYLE_SET, 30, 20)
+        grid.brush_size = 3
+        undo = UndoTracker(1, spill=True)
+        paints = []
+        for px, py, layer in ((10, 10, green), (np.array([5, 6, 7]), np.array([3, 3, 4]), red), (20, 15, blue)):
+            xs, ys, changed = grid.paint_footprint(layer, px, py)
+            paints.append(BrushPaint.record(px, py, grid.brush_size, grid.brush_shape, layer, grid.x, grid.y, changed))
+            undo.add_action(PaintAction(paints=[paints[-1]]))
+        self.assertGreater(undo.spilled_bytes, 0)
+        self.assertEqual(len(undo.undo_tracker), 1)
+        for i, paint in enumerate(reversed(paints)):
+            undone = undo.undo(grid)
+            self.assertEqual(len(undone.paints), 1)
+            # All but the newest were loaded back from disk.
+            if i > 0:
+                self.assertIsNot(undone.paints[0], paint)
+            self.assertIs(undone.paints[0].layer, paint.layer)
+            self.assertEqual(undone.paints[0].squares()[0].tolist(), paint.squares()[0].tolist())
+            self.assertEqual(undone.paints[0].squares()[1].tolist(), paint.squares()[1].tolist())
+        self.assertGridEqual(grid, Grid(Grid.DRAW_STYLE_SET, 30, 20))
+
+        # Actions which cannot be saved are dropped with everything older, leaving no gap.
+        local = Layer(-1, lambda color, timestamp, x, y: color)
+        undo = UndoTracker(budget, spill=True)
+        for action in actions[:100]:
+            undo.add_action(action)
+        self.assertGreater(undo.spilled_bytes, 0)
+        undo.add_action(PaintAction([PaintStep((0, 0), local)] * 40))
+        for action in actions[100:150]:
+            undo.add_action(action)
+        count = 0
+        while undo.undo(grid) is not None:
+            count += 1
+        self.assertLess(count, 51)
+        self.assertEqual(undo.undo_spill.nbytes, 0)
+
     def assertGridEqual(self, grid1: Grid, grid2: Grid):
         for x in range(len(grid1.grid)):
             for y in range(len(grid1[x])):
@@ -14,6 +14,14 @@ FakeWindow.on_reset = MyWindow.on_reset
 FakeWindow.on_paint = MyWindow.on_paint
 FakeWindow.on_increase_brush_size = MyWindow.on_increase_brush_size
 FakeWindow.on_decrease_brush_size = MyWindow.on_decrease_brush_size
+FakeWindow.try_draw = MyWindow.try_draw
+FakeWindow.flush_stroke = MyWindow.flush_stroke
+FakeWindow.on_stroke_start = MyWindow.on_stroke_start
+FakeWindow.on_stroke_end = MyWindow.on_stroke_end
+FakeWindow.split_stroke = MyWindow.split_stroke
+FakeWindow.record_action = MyWindow.record_action
+FakeWindow.on_undo = MyWindow.on_undo
+FakeWindow.on_redo = MyWindow.on_redo
 
 class TestGrid(unittest.TestCase):
 
@@ -70,7 +78,7 @@ class TestGrid(unittest.TestCase):
 
         self.assertGridEqual(grid, control_grid)
 
-        # Increase past maximum
+        # Larger brushes reach the whole corner
         fw.on_increase_brush_size()
         fw.on_increase_brush_size()
         fw.on_increase_brush_size()
@@ -79,10 +87,90 @@ class TestGrid(unittest.TestCase):
         for x in range(5):
             for y in range(5):
                 control_grid[x][y].add(green)
-        control_grid[4][4].add(blue)
 
         self.assertGridEqual(grid, control_grid)
 
+    @number("6.3")
+    def test_stroke(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 12, 8)
+        control_grid = Grid(Grid.DRAW_STYLE_ADD, 12, 8)
+
+        fw = FakeWindow(grid)
+        fw.on_init()
+        fw.on_reset()
+        fw.GRID_SQ_WIDTH = fw.GRID_SQ_HEIGHT = 10
+        fw.selected_layer_index = blue.index
+        fw.stroke, fw.prev_pos, fw.prev_drawn = [], None, None
+        grid.brush_size = 1
+        # One frame's motion events, painted together.
+        for x, y in ((15, 15), (35, 18), (55, 45)):
+            fw.try_draw(x, y)
+        self.assertGridEqual(grid, control_grid)
+        fw.flush_stroke()
+        self.assertEqual(fw.stroke, [])
+        self.assertEqual(fw.prev_drawn, (5, 4))
+        centres = [(1, 1), (2, 1), (3, 1), (3, 2), (4, 2), (4, 3), (5, 3), (5, 4)]
+        painted = set()
+        for px, py in centres:
+            for x in range(12):
+                for y in range(8):
+                    if abs(x - px) + abs(y - py) <= 1:
+                        painted.add((x, y))
+        for x, y in painted:
+            control_grid[x][y].add(blue)
+        self.assertGridEqual(grid, control_grid)
+
+        # The next frame starts where the last one ended.
+        fw.try_draw(56, 46)
+        fw.flush_stroke()
+        self.assertGridEqual(grid, control_grid)
+        fw.try_draw(56, 56)
+        fw.flush_stroke()
+        for x, y in ((5, 5), (4, 5), (6, 5), (5, 6), (5, 4)):
+            control_grid[x][y].add(blue)
+        self.assertGridEqual(grid, control_grid)
+
+    @number("6.4")
+    def test_stroke_actions(self):
+        grid = Grid(Grid.DRAW_STYLE_ADD, 8, 8)
+        empty_grid = Grid(Grid.DRAW_STYLE_ADD, 8, 8)
+
+        fw = FakeWindow(grid)
+        fw.on_init()
+        fw.on_reset()
+        # Overlapping paints, even of the same square, make one action.
+        fw.on_stroke_start()
+        fw.on_paint(red, 2, 2)
+        fw.on_paint(red, 3, 2)
+        fw.on_paint(blue, 3, 2)
+        fw.on_stroke_end()
+        self.assertEqual(len(fw.undo_tracker.undo_tracker), 1)
+        self.assertEqual(len(fw.replay_tracker.replay_tracker), 1)
+        self.assertEqual(fw.undo_tracker.undo_tracker.peek().changed_count(), 3 * 13)
+        painted = Grid(Grid.DRAW_STYLE_ADD, 8, 8)
+        for px, py, layer in ((2, 2, red), (3, 2, red), (3, 2, blue)):
+            for x in range(8):
+                for y in range(8):
+                    if abs(x - px) + abs(y - py) <= 2:
+                        painted[x][y].add(layer)
+        self.assertGridEqual(grid, painted)
+        fw.on_undo()
+        self.assertGridEqual(grid, empty_grid)
+        fw.on_redo()
+        self.assertGridEqual(grid, painted)
+
+        # Strokes which change nothing are dropped.
+        grid = Grid(Grid.DRAW_STYLE_SET, 8, 8)
+        fw = FakeWindow(grid)
+        fw.on_init()
+        fw.on_paint(green, 4, 4)
+        fw.on_stroke_start()
+        fw.on_paint(green, 4, 4)
+        fw.on_stroke_end()
+        fw.on_stroke_end()
+        self.assertEqual(len(fw.undo_tracker.undo_tracker), 1)
+        self.assertEqual(len(fw.replay_tracker.replay_tracker), 1)
+
     def assertGridEqual(self, grid1: Grid, grid2: Grid):
         for x in range(len(grid1.grid)):
             for y in range(len(grid1[x])):
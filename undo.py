@@ -1,35 +1,262 @@
 # @File: undo.py
 # @Author: Aoran Li
-# @Last Edit Date: 2023-03-31
+# @Last Edit Date: 2026-10-16
 
 from __future__ import annotations
+import io
+import pickle
+import tempfile
+import zlib
 from action import PaintAction
 from grid import Grid
-from data_structures.stack_adt import *
+from layer_util import Layer, get_layers
+from own_data_structures import ArrayDeque
 
-class UndoTracker:
+class _HistoryPickler(pickle.Pickler):
+    """Pickles actions with registered layers saved by index, as layers hold functions."""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Layer):
+            layers = get_layers()
+            if 0 <= obj.index < len(layers) and layers[obj.index] is obj:
+                return obj.index
+        return None
+
+class _HistoryUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        return get_layers()[pid]
+
+def dump_history(items: list) -> tuple[bytes, int]:
+    """
+    Pickle items in order, one after another, and compress them. Stops before
+    the first item which cannot be pickled, such as an action using a layer
+    defined locally, which is not registered.
+
+    :return: The compressed pickles, and how many of the items they hold.
+    """
+    """
+    Best Complexity: O(n), n being the total size of the items
+    Worst Complexity: O(n)
+    """
+    buffer = io.BytesIO()
+    pickler = _HistoryPickler(buffer, pickle.HIGHEST_PROTOCOL)
+    for count, item in enumerate(items):
+        end = buffer.tell()
+        try:
+            pickler.dump(item)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            buffer.seek(end)
+            buffer.truncate()
+            return zlib.compress(buffer.getvalue()), count
+    return zlib.compress(buffer.getvalue()), len(items)
+
+def load_history(data: bytes) -> list:
+    """
+    The items pickled by dump_history, in order.
+    Best Complexity: O(n), n being the total size of the items
+    Worst Complexity: O(n)
+    """
+    buffer = io.BytesIO(zlib.decompress(data))
+    unpickler = _HistoryUnpickler(buffer)
+    items = []
+    while buffer.tell() < len(buffer.getbuffer()):
+        items.append(unpickler.load())
+    return items
+
+class SpillFile:
+    """
+    Segments of bytes in a temporary file, which is only created when needed.
+    Segments are taken back newest first with pop, or oldest first with serve.
+    """
 
     def __init__(self):
-        self.undo_tracker = ArrayStack(10000)   #Used to store undo operations
-        self.redo_tracker = ArrayStack(10000)   #Used to store redo operations
+        self.file = None
+        self.segments = ArrayDeque()   # (offset, length) of each segment, newest last
+        self.end = 0   # Offset just past the newest segment
+        self.nbytes = 0   # Total length of the segments
 
-    def add_action(self, action: PaintAction) -> None:
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def push(self, data: bytes) -> None:
         """
-        Adds an action to the undo tracker.
+        Write data as the newest segment.
+        Best Complexity: O(n), n being the length of data
+        Worst Complexity: O(n)
+        """
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(self.end)
+        self.file.write(data)
+        self.segments.push((self.end, len(data)))
+        self.end += len(data)
+        self.nbytes += len(data)
+
+    def pop(self) -> bytes:
+        """
+        Remove and return the newest segment, truncating the file.
+        :pre: there is a segment
+        Best Complexity: O(n), n being the length of the segment
+        Worst Complexity: O(n)
+        """
+        offset, length = self.segments.pop()
+        data = self.read(offset, length)
+        self.file.truncate(offset)
+        self.end = offset
+        return data
 
-        If your collection is already full,
-        feel free to exit early and not add the action.
+    def serve(self) -> bytes:
+        """
+        Remove and return the oldest segment. The file is truncated once empty.
+        :pre: there is a segment
+        Best Complexity: O(n), n being the length of the segment
+        Worst Complexity: O(n)
         """
+        offset, length = self.segments.serve()
+        data = self.read(offset, length)
+        if self.segments.is_empty():
+            self.clear()
+        return data
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.file.seek(offset)
+        self.nbytes -= length
+        return self.file.read(length)
+
+    def clear(self) -> None:
         """
+        Discard every segment.
         Best Complexity: O(1)
         Worst Complexity: O(1)
         """
-        if self.undo_tracker.is_full():
+        self.segments.clear()
+        if self.file is not None:
+            self.file.truncate(0)
+        self.end = 0
+        self.nbytes = 0
+
+class UndoTracker:
+    """
+    Undo history bounded by a byte budget, counting PaintAction.nbytes.
+
+    Once the history in memory is over budget, actions are evicted until it is
+    back under LOW_WATER of the budget, like a ring: first the redo actions
+    furthest in the future, then the oldest undo actions, always keeping the
+    nearest action on each side. When redoing, the oldest undo actions go first.
+    With spill set, evicted actions are compressed and written to a temporary
+    file as one segment per side, and paged back in, nearest segment first,
+    when undoing or redoing reaches them. Otherwise they are discarded.
+
+    The history must stay contiguous, so if a segment cannot be saved, as its
+    actions use layers which are not registered, it is discarded together with
+    every segment further away on its side.
+    """
+
+    DEFAULT_BUDGET = 64 * 1024 * 1024   # Bytes
+    LOW_WATER = 0.75   # Fraction of the budget left after evicting
+
+    def __init__(self, budget: int | None = DEFAULT_BUDGET, spill: bool = False):
+        """
+        budget: Most bytes of actions to keep in memory, or None for no limit.
+        spill: Whether to spill evicted actions to disk rather than discard them.
+        """
+        self.undo_tracker = ArrayDeque()   #Used to store undo operations, oldest at the front
+        self.redo_tracker = ArrayDeque()   #Used to store redo operations, furthest in the future at the front
+        self.budget = budget
+        self.spill = spill
+        self.nbytes = 0   # Bytes of the actions held in memory
+        self.undo_spill = SpillFile()   # Spilled undo actions, newest segment last
+        self.redo_spill = SpillFile()   # Spilled redo actions, nearest segment last
+
+    def add_action(self, action: PaintAction) -> None:
+        """
+        Adds an action to the undo tracker.
+        Evicts actions if the history goes over budget.
+        """
+        """
+        Best Complexity: O(1)
+        Worst Complexity: O(n), n being the number of actions evicted or redo actions cleared
+        """
+        # Add the action to the undo tracker and clear the redo tracker
+        self.undo_tracker.push(action)
+        self.nbytes += action.nbytes
+        while not self.redo_tracker.is_empty():
+            self.nbytes -= self.redo_tracker.pop().nbytes
+        self.redo_spill.clear()
+        self.evict()
+
+    def evict(self, future_first: bool = True) -> None:
+        """
+        If over budget, remove actions until under LOW_WATER of the budget,
+        from the far end of the redo side and then of the undo side, or the
+        other way around if not future_first, keeping the nearest action on
+        each side, and spill them if enabled.
+        Best Complexity: O(1), when within budget
+        Worst Complexity: O(n), n being the total size of the actions evicted
+        """
+        if self.budget is None or self.nbytes <= self.budget:
             return
-        else:
-            # Add the action to the undo tracker and clear the redo tracker
+        target = int(self.budget * self.LOW_WATER)
+        sides = [(self.redo_tracker, self.redo_spill), (self.undo_tracker, self.undo_spill)]
+        if not future_first:
+            sides.reverse()
+        for tracker, spill_file in sides:
+            evicted = []
+            while self.nbytes > target and len(tracker) > 1:
+                action = tracker.serve()
+                self.nbytes -= action.nbytes
+                evicted.append(action)
+            if self.spill and evicted:
+                self.spill_segment(spill_file, evicted)
+
+    def spill_segment(self, spill_file: SpillFile, actions: list[PaintAction]) -> None:
+        """
+        Compress actions, furthest first, and append them to spill_file as one segment.
+        If they cannot all be saved, discard them and every segment already in spill_file.
+        Best Complexity: O(n), n being the total size of the actions
+        Worst Complexity: O(n)
+        """
+        data, count = dump_history(actions)
+        if count < len(actions):
+            # Such as layers defined locally, which are not registered.
+            # Older segments would leave a gap in the history, so drop them too.
+            spill_file.clear()
+            return
+        spill_file.push(data)
+
+    def page_in(self) -> None:
+        """
+        Move the newest spilled undo segment back into memory, in front of the undo tracker.
+        :pre: the undo tracker is empty
+        """
+        """
+        Best Complexity: O(n), n being the total size of the actions
+        Worst Complexity: O(n)
+        """
+        for action in load_history(self.undo_spill.pop()):
             self.undo_tracker.push(action)
-            self.redo_tracker.clear()
+            self.nbytes += action.nbytes
+        self.evict()
+
+    def page_in_redo(self) -> None:
+        """
+        Move the nearest spilled redo segment back into memory, in front of the redo tracker.
+        :pre: the redo tracker is empty
+        """
+        """
+        Best Complexity: O(n), n being the total size of the actions
+        Worst Complexity: O(n)
+        """
+        for action in load_history(self.redo_spill.pop()):
+            self.redo_tracker.push(action)
+            self.nbytes += action.nbytes
+        self.evict(future_first=False)
+
+    @property
+    def spilled_bytes(self) -> int:
+        """Bytes of compressed actions in the spill files."""
+        return self.undo_spill.nbytes + self.redo_spill.nbytes
 
     def undo(self, grid: Grid) -> PaintAction|None:
         """
@@ -40,8 +267,10 @@ class UndoTracker:
         """
         """
         Best Complexity: O(1)
-        Worst Complexity: O(1)
+        Worst Complexity: O(n), when paging a spilled segment back in
         """
+        if self.undo_tracker.is_empty() and len(self.undo_spill) > 0:
+            self.page_in()
         if self.undo_tracker.is_empty():
             return None
         else:
@@ -60,8 +289,10 @@ class UndoTracker:
         """
         """
         Best Complexity: O(1)
-        Worst Complexity: O(1)
+        Worst Complexity: O(n), when paging a spilled segment back in
         """
+        if self.redo_tracker.is_empty() and len(self.redo_spill) > 0:
+            self.page_in_redo()
         if self.redo_tracker.is_empty():
             return None
         else:
@@ -69,4 +300,4 @@ class UndoTracker:
             redo_operation = self.redo_tracker.pop()
             self.undo_tracker.push(redo_operation)
             redo_operation.redo_apply(grid)
-            return redo_operation
\ No newline at end of file
+            return redo_operation